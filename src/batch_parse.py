@@ -0,0 +1,285 @@
+import argparse
+import collections
+import glob
+import hashlib
+import json
+import os
+import shutil
+import signal
+import sys
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+warnings.simplefilter(action="ignore", category=FutureWarning)
+from src import encoding, html_parsing, html2csv, table_stream
+
+MANIFEST_NAME = "manifest.jsonl"
+
+
+def find_filings(inputs):
+    """
+    Expand directories and glob patterns into a sorted list of .htm filings,
+    each named by its path relative to the input it was found under.
+
+    Args:
+        inputs (list): Directories (searched recursively) or glob patterns
+
+    Returns:
+        list: Unique (filing path, name) pairs
+    """
+    names = {}
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            root = pattern
+            pattern = os.path.join(pattern, "**", "*.htm")
+        else:
+            root = glob_root(pattern)
+        for path in glob.glob(pattern, recursive=True):
+            if os.path.isfile(path) and path not in names:
+                names[path] = filing_name(path, root)
+    # Filings found under different inputs can share a relative path
+    counts = collections.Counter(names.values())
+    return sorted(
+        (path, name if counts[name] == 1 else f"{name}_{path_hash(path)}")
+        for path, name in names.items()
+    )
+
+
+def glob_root(pattern):
+    # Directory a glob pattern searches from: its parts before any wildcard
+    parts = os.path.dirname(pattern).split(os.sep)
+    for i, part in enumerate(parts):
+        if any(c in part for c in "*?["):
+            parts = parts[:i]
+            break
+    return os.sep.join(parts) or os.curdir
+
+
+def filing_name(path, root):
+    # EDGAR filings are saved as <cik>_<accession>_<form>... .htm; those in
+    # subfolders of the input keep them, so equal file names do not clash
+    name = os.path.splitext(os.path.relpath(path, root))[0]
+    return name.replace(os.sep, "/")
+
+
+def path_hash(path):
+    return hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:8]
+
+
+def load_manifest(output_dir):
+    """
+    Read the manifest of a previous run.
+
+    Returns:
+        dict: Latest record per source path
+    """
+    records = {}
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return records
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Truncated last line of a crashed run
+                continue
+            records[record["source"]] = record
+    return records
+
+
+def is_done(record, path, name):
+    # A filing recorded under another name was written elsewhere, or over
+    # another filing of the same name by an older run
+    if not record or record["status"] != "ok" or record.get("name") != name:
+        return False
+    stat = os.stat(path)
+    return record["size"] == stat.st_size and record["mtime"] == stat.st_mtime
+
+
+def _raise_timeout(signum, frame):
+    raise TimeoutError
+
+
+def parse_filing(path, output_dir, timeout=None, stream=False, name=None):
+    """
+    Parse one filing and write its tables to <output_dir>/<name>/.
+
+    Tables are written to a temporary directory that replaces the final one
+    only once every table is on disk, so a crash never leaves a partial
+    filing behind.
+
+    Args:
+        path (str): Path to the .htm filing
+        output_dir (str): Root of the parsed table layout
+        timeout (int, optional): Seconds before the filing is abandoned
+        stream (bool): Read the filing with table_stream, in memory bounded
+                       by its largest table, keeping tables outside the
+                       item sections
+        name (str, optional): Output name from find_filings, by default the
+                              file name without extension
+
+    Returns:
+        dict: Manifest record for the filing
+    """
+    stat = os.stat(path)
+    name = name or filing_name(path, os.path.dirname(path))
+    record = {
+        "source": path,
+        "name": name,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "tables": 0,
+    }
+    use_alarm = timeout and hasattr(signal, "SIGALRM")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.alarm(timeout)
+    t0 = time.perf_counter()
+    try:
+        if stream:
+            table_map = [0]
+            csv_tables = (
+                csv_table
+                for _, csv_table in html2csv.iter_process(
+                    table_stream.iter_records(path), table_map=table_map
+                )
+            )
+        else:
+            with open(path, "rb") as f:
+                processed_html = html_parsing.parse_html(encoding.decode_html(f.read()))
+            csv_tables, table_map = html2csv.process(processed_html)
+
+        target = os.path.join(output_dir, name)
+        partial = target + ".partial"
+        shutil.rmtree(partial, ignore_errors=True)
+        os.makedirs(partial)
+        n_tables = 0
+        for table in csv_tables:
+            n_tables += 1
+            with open(
+                os.path.join(partial, f"table_{n_tables}.csv"), "w", encoding="utf-8"
+            ) as f:
+                f.write(table)
+        with open(os.path.join(partial, "table_map.json"), "w") as f:
+            json.dump(table_map, f)
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(partial, target)
+
+        record.update(status="ok", tables=n_tables, output=target)
+    except TimeoutError:
+        record.update(status="timeout", error=f"exceeded {timeout}s")
+    except Exception as e:
+        record.update(status="error", error=f"{type(e).__name__}: {e}")
+    finally:
+        if use_alarm:
+            signal.alarm(0)
+    record["seconds"] = round(time.perf_counter() - t0, 3)
+    return record
+
+
+def run_batch(filings, output_dir, jobs=None, timeout=None, resume=True, stream=False):
+    """
+    Parse filings across a process pool, appending one manifest record per
+    finished filing.
+
+    Args:
+        filings (list): (filing path, name) pairs, as from find_filings
+        output_dir (str): Root of the parsed table layout
+        jobs (int, optional): Worker processes, defaults to the CPU count
+        timeout (int, optional): Per-filing timeout in seconds
+        resume (bool): Skip filings recorded as done in the manifest
+        stream (bool): Read filings with table_stream (see parse_filing)
+
+    Returns:
+        list: Manifest records of this run
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    done = load_manifest(output_dir) if resume else {}
+    todo = [(p, name) for p, name in filings if not is_done(done.get(p), p, name)]
+    if len(todo) < len(filings):
+        print(f"Skipping {len(filings) - len(todo)} filings already parsed")
+
+    records = []
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(manifest_path, "a", encoding="utf-8") as manifest, ProcessPoolExecutor(
+        max_workers=jobs
+    ) as pool:
+        futures = {
+            pool.submit(parse_filing, path, output_dir, timeout, stream, name): path
+            for path, name in todo
+        }
+        for future in as_completed(futures):
+            try:
+                record = future.result()
+            except BrokenProcessPool as e:
+                # A worker died (e.g. out of memory); the rest can be resumed
+                record = {"source": futures[future], "status": "error", "error": str(e)}
+            records.append(record)
+            manifest.write(json.dumps(record) + "\n")
+            manifest.flush()
+            os.fsync(manifest.fileno())
+            print(
+                f"[{len(records)}/{len(todo)}] {record['status']:<7} "
+                f"{record.get('tables', 0):>4} tables  {futures[future]}"
+            )
+    return records
+
+
+def summarize(records, elapsed):
+    ok = [r for r in records if r["status"] == "ok"]
+    tables = sum(r["tables"] for r in ok)
+    failed = len(records) - len(ok)
+    print(
+        f"Parsed {len(ok)} filings ({failed} failed), {tables} tables "
+        f"in {elapsed:.1f}s: {len(ok) / elapsed if elapsed else 0:.2f} files/sec, "
+        f"{tables / elapsed if elapsed else 0:.2f} tables/sec"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Parse tables from a batch of .htm filings"
+    )
+    parser.add_argument(
+        "inputs", nargs="+", help="Directories or glob patterns of .htm filings"
+    )
+    parser.add_argument(
+        "-o", "--output", default="data/parsed_table", help="Output directory"
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=None, help="Number of worker processes"
+    )
+    parser.add_argument(
+        "-t", "--timeout", type=int, default=600, help="Per-filing timeout in seconds"
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="Re-parse filings already recorded in the manifest",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream very large filings in bounded memory, keeping every table",
+    )
+
+    args = parser.parse_args()
+    filings = find_filings(args.inputs)
+    if not filings:
+        print(f"No .htm files found in {' '.join(args.inputs)}")
+        sys.exit(1)
+    print(f"Found {len(filings)} filings")
+
+    t0 = time.perf_counter()
+    records = run_batch(
+        filings,
+        args.output,
+        args.jobs,
+        args.timeout or None,
+        not args.no_resume,
+        args.stream,
+    )
+    summarize(records, time.perf_counter() - t0)
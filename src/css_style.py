@@ -0,0 +1,115 @@
+import re
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+# Filings repeat a few hundred distinct style strings thousands of times, so
+# each distinct string is parsed once
+
+margin_left_re = re.compile(r"margin-left:(\d+)pt;")
+text_indent_re = re.compile(r"text-indent:([\d.]+)pt")
+pt_re = re.compile(r"([\d.]+)pt")
+
+CACHE_SIZE = 4096
+
+
+class Style(NamedTuple):
+    """
+    Properties of an inline style attribute.
+
+    indent_pt, weight, italic, align and transform follow the first
+    declaration naming each property, as html_parse reads table cells.
+    margin_left_pt and text_indent_pt are the strict "margin-left:<int>pt;"
+    and "text-indent:<number>pt" forms html_parsing indents paragraphs by.
+    """
+
+    indent_pt: float = 0.0
+    weight: Optional[str] = None
+    italic: bool = False
+    align: Optional[str] = None
+    transform: Optional[str] = None
+    margin_left_pt: Optional[int] = None
+    text_indent_pt: Optional[float] = None
+
+
+def _value(declarations, name):
+    for item in declarations:
+        if name in item:
+            parts = item.split(":")
+            return parts[1].strip() if len(parts) > 1 else None
+    return None
+
+
+def _pt(declarations, name):
+    # Last pt length of the first declaration naming `name` that has one
+    for item in declarations:
+        if name not in item:
+            continue
+        pt_values = pt_re.findall(item)
+        if pt_values:
+            try:
+                return float(pt_values[-1])
+            except ValueError:
+                return None
+    return None
+
+
+def _float(text):
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_style(style):
+    """
+    Parse an inline style attribute. Malformed declarations read as absent.
+
+    Args:
+        style (str): Raw value of the style attribute
+
+    Returns:
+        Style: Parsed properties
+    """
+    declarations = style.strip(";").split(";")
+
+    indent_pt = 0.0
+    margin = _pt(declarations, "margin")
+    if margin is not None:
+        indent_pt = margin
+    margin_left = _pt(declarations, "margin-left")
+    if margin_left is not None:
+        indent_pt = margin_left
+    text_indent = _value(declarations, "text-indent")
+    if text_indent is not None:
+        # e.g. "margin-left: 24pt; text-indent: -12pt"
+        text_indent = _float(text_indent.split(":")[-1].strip()[:-2])
+        if text_indent is not None:
+            indent_pt = indent_pt + text_indent if indent_pt != 0.0 else text_indent
+
+    m = margin_left_re.search(style)
+    margin_left_pt = int(m.group(1)) if m else None
+    m = text_indent_re.search(style)
+    text_indent_pt = _float(m.group(1)) if m else None
+
+    return Style(
+        indent_pt=indent_pt,
+        weight=_value(declarations, "font-weight"),
+        italic=_value(declarations, "font-style") == "italic",
+        align=_value(declarations, "text-align"),
+        transform=_value(declarations, "text-transform"),
+        margin_left_pt=margin_left_pt,
+        text_indent_pt=text_indent_pt,
+    )
+
+
+def cache_stats():
+    info = parse_style.cache_info()
+    total = info.hits + info.misses
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "hit_rate": info.hits / total if total else 0.0,
+        "size": info.currsize,
+        "max_size": info.maxsize,
+    }
@@ -1,12 +1,220 @@
 import os
+import csv
+import io
 import json
+import contextlib
+import threading
+import time
 import pandas as pd
 import argparse
+import bisect
+import fnmatch
 import glob
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 
+from src import edit_compaction
 
-def process_edits(csv_folder_path, json_path, output_folder=None):
+INT64_MIN = -(2**63)
+INT64_MAX = 2**63 - 1
+
+
+class Table:
+    """
+    A CSV held as a list of rows for replaying edits, read once and written
+    once.
+
+    Cells keep the values pd.read_csv gives them, and each column follows
+    the dtype a DataFrame column would have ("int", "float", "bool" or
+    "object"), so edits convert values and the file is written as with
+    df.to_csv(index=False).
+    """
+
+    def __init__(self, columns, rows, kinds=None):
+        self.columns = columns
+        self.rows = rows
+        self.kinds = kinds or ["object"] * len(columns)
+
+    @classmethod
+    def read_csv(cls, path):
+        df = pd.read_csv(path)
+        kinds = [
+            {"i": "int", "u": "int", "f": "float", "b": "bool"}.get(
+                dtype.kind, "object"
+            )
+            for dtype in df.dtypes
+        ]
+        data = [df.iloc[:, c].tolist() for c in range(df.shape[1])]
+        return cls(list(df.columns), [list(row) for row in zip(*data)], kinds)
+
+    def to_csv(self, path):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f, lineterminator=os.linesep)
+            writer.writerow(self.columns)
+            # Missing values are written empty
+            writer.writerows(
+                ["" if cell is None or cell != cell else cell for cell in row]
+                for row in self.rows
+            )
+
+    def set(self, row, col, value):
+        """
+        Set a cell, converting it or its column as a DataFrame column of
+        that dtype would: an int column holds integral numbers and becomes
+        float for other numbers, a float column holds numbers and a bool
+        column booleans; anything else makes the column object.
+        """
+        kind = self.kinds[col]
+        is_number = isinstance(value, (int, float)) and not isinstance(value, bool)
+        if kind == "int":
+            if (
+                isinstance(value, float)
+                and value.is_integer()
+                and INT64_MIN <= value <= INT64_MAX
+            ):
+                value = int(value)
+            if isinstance(value, float):
+                for cells in self.rows:
+                    cells[col] = float(cells[col])
+                self.kinds[col] = "float"
+            elif not is_number or not INT64_MIN <= value <= INT64_MAX:
+                self.kinds[col] = "object"
+        elif kind == "float":
+            if is_number:
+                value = float(value)
+            else:
+                self.kinds[col] = "object"
+        elif kind == "bool" and not isinstance(value, bool):
+            self.kinds[col] = "object"
+        self.rows[row][col] = value
+
+    def add_col(self, index, name=""):
+        self.columns.insert(index, name)
+        self.kinds.insert(index, "object")
+        for cells in self.rows:
+            cells.insert(index, "")
+
+    def remove_col(self, index):
+        del self.columns[index]
+        del self.kinds[index]
+        for cells in self.rows:
+            del cells[index]
+
+
+class CsvIndex:
+    """
+    Names in a CSV folder, listed once so the files a log refers to are
+    found without a directory scan per file. find() resolves names as
+    find_csv does.
+
+    The listing can be cached on disk, where it is used again as long as
+    the folder's mtime is unchanged.
+    """
+
+    def __init__(self, folder, names, dangling=(), stamp=None):
+        self.folder = folder
+        self.stamp = stamp
+        # Names in directory order, the order glob returns them in
+        self.names = list(names)
+        self._order = {name: i for i, name in enumerate(self.names)}
+        self._sorted = sorted(self.names)
+        # Broken symlinks, which glob lists but os.path.exists denies
+        self._dangling = set(dangling)
+
+    @staticmethod
+    def _stamp(folder):
+        st = os.stat(folder)
+        return [st.st_mtime_ns, st.st_size, st.st_ino]
+
+    @classmethod
+    def load(cls, folder, cache_path=None):
+        """
+        List a folder, or read its listing from cache_path if the folder has
+        not changed since it was written.
+        """
+        stamp = cls._stamp(folder)
+        key = os.path.abspath(folder)
+        if cache_path:
+            try:
+                with open(cache_path, "r", encoding="utf-8") as f:
+                    cached = json.load(f)
+                if cached["folder"] == key and cached["stamp"] == stamp:
+                    return cls(folder, cached["names"], cached["dangling"], stamp)
+            except (OSError, ValueError, KeyError):
+                pass
+
+        names, dangling = [], []
+        with os.scandir(folder) as it:
+            for entry in it:
+                names.append(entry.name)
+                if entry.is_symlink() and not os.path.exists(entry.path):
+                    dangling.append(entry.name)
+        index = cls(folder, names, dangling, stamp)
+
+        # A folder changed within the mtime's granularity of being listed
+        # may change again without its mtime moving
+        if cache_path and time.time_ns() - stamp[0] > 2 * 10**9:
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {
+                        "folder": key,
+                        "stamp": stamp,
+                        "names": names,
+                        "dangling": dangling,
+                    },
+                    f,
+                )
+            os.replace(tmp_path, cache_path)
+        return index
+
+    def add(self, name):
+        # Record a file written into the folder
+        if name not in self._order:
+            self._order[name] = len(self.names)
+            self.names.append(name)
+            bisect.insort(self._sorted, name)
+        self._dangling.discard(name)
+
+    def find(self, file_name):
+        """
+        Returns:
+            str: Path of the file, or of the first CSV sharing its base name;
+                 None if there is neither
+        """
+        if (
+            not file_name
+            or file_name in (os.curdir, os.pardir)
+            or os.sep in file_name
+            or (os.altsep and os.altsep in file_name)
+            or glob.has_magic(self.folder)
+        ):
+            # Not a plain name in the folder
+            return find_csv(self.folder, file_name)
+        if file_name in self._order and file_name not in self._dangling:
+            return os.path.join(self.folder, file_name)
+
+        base_name = Path(file_name).stem
+        pattern = f"{base_name}*.csv"
+        if glob.has_magic(base_name):
+            candidates = self.names
+        else:
+            start = bisect.bisect_left(self._sorted, base_name)
+            end = bisect.bisect_left(self._sorted, base_name + "\U0010ffff")
+            candidates = self._sorted[start:end]
+        matches = fnmatch.filter(candidates, pattern)
+        if not base_name.startswith("."):
+            # glob skips hidden files unless the pattern names them
+            matches = [name for name in matches if not name.startswith(".")]
+        if not matches:
+            return None
+        return os.path.join(self.folder, min(matches, key=self._order.__getitem__))
+
+
+def process_edits(
+    csv_folder_path, json_path, output_folder=None, compact=False, index=None
+):
     """
     Process edits defined in JSON file for CSV files in a folder.
 
@@ -15,21 +223,54 @@ def process_edits(csv_folder_path, json_path, output_folder=None):
         json_path (str): Path to the JSON file with edit instructions
         output_folder (str, optional): Path to save the edited CSV files.
                                        If None, will save in the same folder with '_edited' suffix.
+        compact (bool): Compact each file's instructions before replaying them
+        index (CsvIndex, optional): Listing of csv_folder_path, to share one
+                                    between logs; made here if not given
+
+    Returns:
+        int: Number of instructions replayed
     """
     # Verify paths exist
     if not os.path.exists(csv_folder_path):
         print(f"CSV folder not found at {csv_folder_path}")
-        return
+        return 0
 
     if not os.path.exists(json_path):
         print(f"JSON file not found at {json_path}")
-        return
+        return 0
 
-    if not os.path.exists(output_folder) and output_folder is not None:
+    if output_folder is not None and not os.path.exists(output_folder):
         os.makedirs(output_folder, exist_ok=True)
         print(f"Output folder created at {output_folder}")
 
-    # Load JSON instructions
+    file_instructions = load_instructions(json_path)
+    if index is None:
+        index = CsvIndex.load(csv_folder_path)
+
+    # Process each file
+    n_ops = 0
+    for file_name, instr_list in file_instructions.items():
+        csv_path = index.find(file_name)
+        if csv_path is None:
+            print(f"No CSV file found for {file_name}. Skipping.")
+            continue
+        output_path = edited_path(csv_path, output_folder)
+        n_ops += replay(csv_path, instr_list, output_path, compact)
+        if os.path.dirname(os.path.abspath(output_path)) == os.path.abspath(
+            index.folder
+        ):
+            # Later files may resolve to it, as they would with a new scan
+            index.add(os.path.basename(output_path))
+    return n_ops
+
+
+def load_instructions(json_path):
+    """
+    Load an edit log.
+
+    Returns:
+        dict: Instructions grouped by fileName, in log order
+    """
     with open(json_path, "r") as f:
         instructions = json.load(f)
 
@@ -45,75 +286,334 @@ def process_edits(csv_folder_path, json_path, output_folder=None):
             file_instructions[file_name] = []
 
         file_instructions[file_name].append(instruction)
+    return file_instructions
 
-    # Process each file
-    for file_name, instr_list in file_instructions.items():
-        # Find the CSV file in the folder
-        csv_path = os.path.join(csv_folder_path, file_name)
-        if not os.path.exists(csv_path):
-            # Try to find a CSV file with the same base name
-            base_name = Path(file_name).stem
-            possible_files = glob.glob(
-                os.path.join(csv_folder_path, f"{base_name}*.csv")
-            )
 
-            if not possible_files:
-                print(f"No CSV file found for {file_name}. Skipping.")
-                continue
+def find_csv(csv_folder_path, file_name):
+    """
+    Find the CSV file a log's fileName refers to. CsvIndex.find gives the
+    same answer without scanning the folder each time.
 
-            csv_path = possible_files[0]
-            # print(f"Using {csv_path} for instructions related to {file_name}")
+    Returns:
+        str: Path of the file, or of the first CSV sharing its base name;
+             None if there is neither
+    """
+    csv_path = os.path.join(csv_folder_path, file_name)
+    if os.path.exists(csv_path):
+        return csv_path
 
-        # Load the CSV file
-        try:
-            df = pd.read_csv(csv_path)
-        except Exception as e:
-            print(f"Error loading CSV file {csv_path}: {e}")
+    # Try to find a CSV file with the same base name
+    base_name = Path(file_name).stem
+    possible_files = glob.glob(os.path.join(csv_folder_path, f"{base_name}*.csv"))
+    return possible_files[0] if possible_files else None
+
+
+def edited_path(csv_path, output_folder=None):
+    if output_folder:
+        base_name = Path(csv_path).stem
+        return os.path.join(output_folder, f"{base_name}_edited.csv")
+    base_path = Path(csv_path)
+    return str(base_path.parent / f"{base_path.stem}_edited{base_path.suffix}")
+
+
+def replay(csv_path, instr_list, output_path, compact=False):
+    """
+    Apply the instructions of one file and save the result.
+
+    Args:
+        csv_path (str): CSV file the instructions apply to
+        instr_list (list): Instructions, in log order
+        output_path (str): Where the edited CSV is written
+        compact (bool): Replay edit_compaction.compact_file(instr_list) instead,
+                        which leaves the same table
+
+    Returns:
+        int: Number of instructions replayed, 0 if the CSV cannot be loaded
+    """
+    # Load the CSV file
+    try:
+        table = Table.read_csv(csv_path)
+    except Exception as e:
+        print(f"Error loading CSV file {csv_path}: {e}")
+        return 0
+
+    if compact:
+        instr_list = edit_compaction.compact_file(
+            instr_list, (len(table.rows), len(table.columns))
+        )
+
+    # Process instructions for this file
+    for instruction in instr_list:
+        apply_instruction(table, instruction)
+
+    # Save the modified CSV
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    table.to_csv(output_path)
+    return len(instr_list)
+
+
+def apply_instruction(table, instruction):
+    action = instruction.get("action")
+    details = instruction.get("details", {})
+
+    # Apply the instruction based on the action type
+    if action == "edit":
+        apply_edit(table, details)
+    elif action == "remove_row":
+        apply_remove_row(table, details)
+    elif action == "remove_col":
+        apply_remove_col(table, details)
+    elif action == "add_col":
+        apply_add_col(table, details)
+    elif action == "add_row":
+        apply_add_row(table, details)
+    elif action == "merge":
+        apply_merge(table, details)
+    else:
+        print(f"Unknown action: {action}. Skipping.")
+
+
+# Integer details each action needs, and those it may have
+INSTRUCTION_FIELDS = {
+    "edit": (("row", "col"), ()),
+    "add_row": ((), ("index", "amount")),
+    "remove_row": (("index",), ("amount",)),
+    "add_col": ((), ("index", "amount")),
+    "remove_col": ((), ("index", "col", "amount")),
+    "merge": (("index",), ()),
+}
+
+
+def check_instruction(instruction):
+    """
+    Check that an instruction has an action and details apply_instruction
+    can handle.
+
+    Raises:
+        ValueError: If it does not
+    """
+    if not isinstance(instruction, dict):
+        raise ValueError(f"Instruction is not an object: {instruction!r}")
+    action = instruction.get("action")
+    if action not in INSTRUCTION_FIELDS:
+        raise ValueError(f"Unknown action: {action!r}")
+    details = instruction.get("details")
+    if not isinstance(details, dict):
+        raise ValueError(f"{action} needs details, got {details!r}")
+    required, optional = INSTRUCTION_FIELDS[action]
+    for key in required + optional:
+        if key not in details and key not in required:
             continue
+        value = details.get(key)
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise ValueError(f"{action} needs an integer {key}, got {value!r}")
+    if action == "remove_col" and "index" not in details and "col" not in details:
+        raise ValueError("remove_col needs an integer index")
+    if action == "merge" and not isinstance(details.get("isRow", True), bool):
+        raise ValueError(f"merge needs a boolean isRow, got {details['isRow']!r}")
 
-        # Process instructions for this file
-        for instruction in instr_list:
-            action = instruction.get("action")
-            details = instruction.get("details", {})
-
-            # Apply the instruction based on the action type
-            if action == "edit":
-                apply_edit(df, details)
-            elif action == "remove_row":
-                apply_remove_row(df, details)
-            elif action == "remove_col":
-                apply_remove_col(df, details)
-            elif action == "add_col":
-                apply_add_col(df, details)
-            elif action == "add_row":
-                apply_add_row(df, details)
-            elif action == "merge":
-                apply_merge(df, details)
-            else:
-                print(f"Unknown action: {action}. Skipping.")
 
-        # Determine output path
-        if output_folder:
-            os.makedirs(output_folder, exist_ok=True)
-            base_name = Path(csv_path).stem
-            output_path = os.path.join(output_folder, f"{base_name}_edited.csv")
+def apply_to_grid(grid, instructions, errors=None):
+    """
+    Apply instructions to a CSV held as the editor holds it: every cell as
+    text, with the header as row 0.
+
+    Instructions count rows as in an edit log, where table row n is grid
+    row n; only the header, which Table keeps apart, is reached here too.
+
+    Args:
+        grid (list): Rows of cell texts, the header first
+        instructions (list): Instructions, in log order
+        errors (list, optional): If given, an instruction that fails is
+                                 skipped and (instruction, exception)
+                                 appended to it instead of raising
+
+    Returns:
+        list: Rows after the instructions
+    """
+    width = max((len(row) for row in grid), default=0)
+    # Every column is "object", so cells are stored as given
+    table = Table([""] * width, [row + [""] * (width - len(row)) for row in grid])
+    for instruction in instructions:
+        details = dict(instruction.get("details") or {})
+        action = instruction.get("action")
+        # The handlers count table rows, which start one row into the grid
+        if action == "edit":
+            key = "row"
+        elif action in ("add_row", "remove_row") or (
+            action == "merge" and details.get("isRow", True)
+        ):
+            key = "index"
         else:
-            base_path = Path(csv_path)
-            output_path = str(
-                base_path.parent / f"{base_path.stem}_edited{base_path.suffix}"
-            )
+            key = None
+        if isinstance(details.get(key), int):
+            details[key] += 1
+        if errors is None:
+            apply_instruction(table, dict(instruction, details=details))
+            continue
+        try:
+            apply_instruction(table, dict(instruction, details=details))
+        except Exception as e:
+            errors.append((instruction, e))
+    return table.rows
+
 
-        # Save the modified CSV
-        df.to_csv(output_path, index=False)
-        # print(f"Updated CSV saved to {output_path}")
+def apply_deltas(csv_path, instructions):
+    """
+    Apply instructions to a CSV file in place, reading and writing its cells
+    as text (see apply_to_grid). The file is replaced atomically, and left
+    as it was if any instruction fails.
+
+    Returns:
+        int: Number of instructions applied
+
+    Raises:
+        ValueError: If an instruction fails check_instruction
+    """
+    for instruction in instructions:
+        check_instruction(instruction)
+    with open(csv_path, "r", newline="", encoding="utf-8") as f:
+        grid = list(csv.reader(f))
+    grid = apply_to_grid(grid, instructions)
+    tmp_path = f"{csv_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerows(
+            ["" if cell is None else cell for cell in row] for row in grid
+        )
+    os.replace(tmp_path, csv_path)
+    return len(instructions)
 
 
-def apply_edit(df, details):
+def log_output_folder(output_root, json_path):
+    # Logs are exported as log_<name>.json; each gets <output_root>/<name>
+    return os.path.join(
+        output_root, os.path.basename(json_path).split("_")[-1].split(".")[0]
+    )
+
+
+def _replay_unit(groups, compact=False):
+    # Replay, in order, every (log, fileName) group writing the same output
+    # file, capturing what each one prints
+    results = []
+    for json_path, file_name, csv_path, instr_list, output_path in groups:
+        out = io.StringIO()
+        result = {"log": json_path, "file": file_name, "ops": 0, "error": None}
+        try:
+            with contextlib.redirect_stdout(out):
+                result["ops"] = replay(csv_path, instr_list, output_path, compact)
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+        result["messages"] = out.getvalue()
+        results.append(result)
+    return results
+
+
+def replay_logs(
+    csv_folder_path, json_paths, output_root, jobs=None, compact=False, index=None
+):
+    """
+    Replay many edit logs across a process pool.
+
+    Every target file of every log is a unit of work. Files written to the
+    same output path (e.g. by two logs whose names end alike) share a unit
+    and are replayed in log order, so the result matches replaying the logs
+    one after another.
+
+    Args:
+        csv_folder_path (str): Path to the folder containing CSV files
+        json_paths (list): Edit logs, in replay order
+        output_root (str): Each log is saved to log_output_folder(...)
+        jobs (int, optional): Worker processes, defaults to the CPU count
+        compact (bool): Compact each file's instructions before replaying them
+        index (CsvIndex, optional): Listing of csv_folder_path; made here,
+                                    once for all logs, if not given
+
+    Returns:
+        list: Per log, a dict with the files and ops replayed, the messages
+              printed while replaying and the errors met
+    """
+    if index is None:
+        index = CsvIndex.load(csv_folder_path)
+    # Per log, the messages printed while reading it and the files queued,
+    # in log order
+    steps = {}
+    units = {}
+    for json_path in json_paths:
+        steps[json_path] = log_steps = []
+        out = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(out):
+                file_instructions = load_instructions(json_path)
+        except Exception as e:
+            log_steps.append(("error", f"{type(e).__name__}: {e}"))
+            continue
+        finally:
+            log_steps.append(("messages", out.getvalue()))
+        output_folder = log_output_folder(output_root, json_path)
+        for file_name, instr_list in file_instructions.items():
+            csv_path = index.find(file_name)
+            if csv_path is None:
+                log_steps.append(
+                    ("messages", f"No CSV file found for {file_name}. Skipping.\n")
+                )
+                continue
+            output_path = edited_path(csv_path, output_folder)
+            units.setdefault(output_path, []).append(
+                (json_path, file_name, csv_path, instr_list, output_path)
+            )
+            log_steps.append(("file", file_name))
+
+    results = {}
+    if units:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {
+                pool.submit(_replay_unit, groups, compact): groups
+                for groups in units.values()
+            }
+            for future in as_completed(futures):
+                try:
+                    unit_results = future.result()
+                except BrokenProcessPool as e:
+                    # A worker died; its files are reported as failed
+                    unit_results = [
+                        {
+                            "log": group[0],
+                            "file": group[1],
+                            "ops": 0,
+                            "error": f"BrokenProcessPool: {e}",
+                            "messages": "",
+                        }
+                        for group in futures[future]
+                    ]
+                for result in unit_results:
+                    results[result["log"], result["file"]] = result
+
+    reports = []
+    for json_path, log_steps in steps.items():
+        report = {"log": json_path, "files": 0, "ops": 0, "messages": "", "errors": []}
+        for kind, value in log_steps:
+            if kind == "messages":
+                report["messages"] += value
+            elif kind == "error":
+                report["errors"].append(value)
+            else:
+                result = results[json_path, value]
+                report["messages"] += result["messages"]
+                report["ops"] += result["ops"]
+                if result["error"]:
+                    report["errors"].append(f"{value}: {result['error']}")
+                else:
+                    report["files"] += 1
+        reports.append(report)
+    return reports
+
+
+def apply_edit(table, details):
     """
-    Apply an edit to a specific cell in the dataframe.
+    Apply an edit to a specific cell in the table.
 
     Args:
-        df (pandas.DataFrame): The dataframe to modify
+        table (Table): The table to modify
         details (dict): Details of the edit, including row, col, oldVal, newVal
     """
     row = details.get("row") - 1
@@ -122,12 +622,12 @@ def apply_edit(df, details):
     new_val = details.get("newVal")
 
     # Check if row and column indices are valid
-    if row >= len(df) or col >= len(df.columns):
+    if row >= len(table.rows) or col >= len(table.columns):
         print(f"Invalid row or column index: row={row}, col={col}. Skipping edit.")
         return
 
     # Verify the old value matches (if provided)
-    current_val = str(df.iloc[row, col])
+    current_val = str(table.rows[row][col])
     if old_val is not None and current_val != str(old_val):
         print(
             f"Value mismatch at row={row}, col={col}. Expected '{old_val}', found '{current_val}'. Proceeding anyway."
@@ -136,17 +636,17 @@ def apply_edit(df, details):
     # Apply the edit
     if new_val is None:
         # If newVal is null, set the cell to empty
-        df.iloc[row, col] = ""
+        table.set(row, col, "")
     else:
-        df.iloc[row, col] = new_val
+        table.set(row, col, new_val)
 
 
-def apply_remove_row(df, details):
+def apply_remove_row(table, details):
     """
-    Remove multiple rows from the dataframe starting at a specified index.
+    Remove multiple rows from the table starting at a specified index.
 
     Args:
-        df (pandas.DataFrame): The dataframe to modify
+        table (Table): The table to modify
         details (dict): Details including:
             - index: The starting row index to remove rows from
             - amount: The number of rows to remove
@@ -160,33 +660,28 @@ def apply_remove_row(df, details):
         amount = 1
 
     # Check if starting index is valid
-    if start_index >= len(df):
+    if start_index < 0 or start_index >= len(table.rows):
         print(f"Invalid starting row index: {start_index}. Skipping row removal.")
         return
 
-    # Adjust amount if it would go beyond the DataFrame
-    if start_index + amount > len(df):
+    # Adjust amount if it would go beyond the table
+    if start_index + amount > len(table.rows):
         print(
-            f"Adjusting removal amount from {amount} to {len(df) - start_index} to avoid going beyond DataFrame bounds."
+            f"Adjusting removal amount from {amount} to {len(table.rows) - start_index} to avoid going beyond DataFrame bounds."
         )
-        amount = len(df) - start_index
+        amount = len(table.rows) - start_index
 
     # Remove the rows
-    rows_to_remove = list(range(start_index, start_index + amount))
-    df.drop(index=rows_to_remove, inplace=True)
-
-    # Reset the index
-    df.reset_index(drop=True, inplace=True)
+    if amount > 0:
+        del table.rows[start_index : start_index + amount]
 
-    # print(f"Removed {amount} rows starting at position {start_index}")
 
-
-def apply_remove_col(df, details):
+def apply_remove_col(table, details):
     """
-    Remove multiple columns from the dataframe starting at a specified index.
+    Remove multiple columns from the table starting at a specified index.
 
     Args:
-        df (pandas.DataFrame): The dataframe to modify
+        table (Table): The table to modify
         details (dict): Details including:
             - index: The starting column index to remove columns from
             - amount: The number of columns to remove
@@ -200,32 +695,34 @@ def apply_remove_col(df, details):
         amount = 1
 
     # Check if starting index is valid
-    if start_index >= len(df.columns):
+    if start_index >= len(table.columns):
         print(f"Invalid starting column index: {start_index}. Skipping column removal.")
         return
 
-    # Adjust amount if it would go beyond the DataFrame
-    if start_index + amount > len(df.columns):
+    # Adjust amount if it would go beyond the table
+    if start_index + amount > len(table.columns):
         print(
-            f"Adjusting removal amount from {amount} to {len(df.columns) - start_index} to avoid going beyond DataFrame bounds."
+            f"Adjusting removal amount from {amount} to {len(table.columns) - start_index} to avoid going beyond DataFrame bounds."
         )
-        amount = len(df.columns) - start_index
-
-    # Get column names to remove
-    cols_to_remove = [df.columns[i] for i in range(start_index, start_index + amount)]
+        amount = len(table.columns) - start_index
 
-    # Remove the columns
-    df.drop(columns=cols_to_remove, inplace=True)
+    # Negative positions count from the end, as with df.columns[i]
+    positions = range(len(table.columns))
+    cols_to_remove = {positions[i] for i in range(start_index, start_index + amount)}
 
-    # print(f"Removed {amount} columns starting at position {start_index}")
+    # Remove the columns by position, as the editor does. The pandas replay
+    # dropped them by label, so removing one of the "" columns add_col
+    # inserts dropped all of them
+    for i in sorted(cols_to_remove, reverse=True):
+        table.remove_col(i)
 
 
-def apply_add_col(df, details):
+def apply_add_col(table, details):
     """
-    Add multiple new columns to the dataframe at a specified index.
+    Add multiple new columns to the table at a specified index.
 
     Args:
-        df (pandas.DataFrame): The dataframe to modify
+        table (Table): The table to modify
         details (dict): Details including:
             - index: The starting column index to insert new columns
             - amount: The number of columns to add
@@ -234,25 +731,22 @@ def apply_add_col(df, details):
     amount = details.get("amount", 1)  # Number of columns to add
 
     # Check if index is valid
-    if start_index > len(df.columns):
+    if start_index > len(table.columns):
         print(f"Invalid starting column index: {start_index}. Will append at the end.")
-        start_index = len(df.columns)
+        start_index = len(table.columns)
 
     # Add the specified number of columns
     for i in range(amount):
-        col_index = start_index + i
-
         # Insert a new empty column
-        df.insert(col_index, "", "", allow_duplicates=True)
-        # print(f"Added new column at position {col_index}")
+        table.add_col(start_index + i)
 
 
-def apply_add_row(df, details):
+def apply_add_row(table, details):
     """
-    Add multiple new rows to the dataframe at a specified index.
+    Add multiple new rows to the table at a specified index.
 
     Args:
-        df (pandas.DataFrame): The dataframe to modify
+        table (Table): The table to modify
         details (dict): Details including:
             - index: The starting row index to insert new rows
             - amount: The number of rows to add
@@ -261,30 +755,23 @@ def apply_add_row(df, details):
     amount = details.get("amount", 1)  # Number of rows to add
 
     # Check if index is valid
-    if start_index > len(df):
+    if start_index > len(table.rows):
         print(f"Invalid starting row index: {start_index}. Will append at the end.")
-        start_index = len(df)
-
-    # Create empty rows (with empty strings for all columns)
-    empty_rows = pd.DataFrame(
-        {col: [""] * amount for col in df.columns}, columns=df.columns
-    )
-
-    # Split the DataFrame into two parts: before and after the insertion point
-    df_before = df.iloc[:start_index].copy()
-    df_after = df.iloc[start_index:].copy()
-
-    # Concatenate the parts with the new empty rows in between
-    new_df = pd.concat([df_before, empty_rows, df_after], ignore_index=True)
-
-    # Replace the original DataFrame with the new one
-    df.drop(df.index, inplace=True)
-    df[new_df.columns] = new_df
+        start_index = len(table.rows)
 
-    # print(f"Added {amount} new rows starting at position {start_index}")
+    if not table.columns:
+        # A DataFrame without columns is left without rows
+        table.rows = []
+    elif amount > 0:
+        # Splice in empty rows (with empty strings for all columns)
+        table.rows[start_index:start_index] = [
+            [""] * len(table.columns) for _ in range(amount)
+        ]
+        # Columns holding "" are of mixed type, as after pd.concat
+        table.kinds = ["object"] * len(table.columns)
 
 
-def apply_merge(df, details):
+def apply_merge(table, details):
     index = details.get("index")
     is_row = details.get("isRow", True)
 
@@ -295,16 +782,16 @@ def apply_merge(df, details):
 
     if is_row:
         # Merging rows
-        if index >= len(df) - 1:
+        if index < 0 or index >= len(table.rows) - 1:
             print(
                 f"Invalid row index {index} for merging. Need at least two rows to merge. Skipping."
             )
             return
 
         # For each column, concatenate the values from the two rows
-        for col_idx in range(len(df.columns)):
-            val1 = str(df.iloc[index, col_idx])
-            val2 = str(df.iloc[index + 1, col_idx])
+        for col_idx in range(len(table.columns)):
+            val1 = str(table.rows[index][col_idx])
+            val2 = str(table.rows[index + 1][col_idx])
 
             # Handle NaN values
             if val1 == "nan" or val1 == "NaN":
@@ -312,26 +799,21 @@ def apply_merge(df, details):
             if val2 == "nan" or val2 == "NaN":
                 val2 = ""
 
-            merged_val = val1 + val2
-
-            df.iloc[index, col_idx] = merged_val
+            table.set(index, col_idx, val1 + val2)
 
         # Remove the second row
-        df.drop(index=index + 1, inplace=True)
-        df.reset_index(drop=True, inplace=True)
-
-        # print(f"Merged rows {index} and {index + 1} by concatenating their content")
+        del table.rows[index + 1]
 
     else:
-        if index >= len(df.columns) - 1:
+        if index < 0 or index >= len(table.columns) - 1:
             print(
                 f"Invalid column index {index} for merging. Need at least two columns to merge. Skipping."
             )
             return
 
         # Get the column names
-        col1_name = df.columns[index]
-        col2_name = df.columns[index + 1]
+        col1_name = table.columns[index]
+        col2_name = table.columns[index + 1]
 
         # Merge the column names
         if col1_name and col2_name:
@@ -340,10 +822,9 @@ def apply_merge(df, details):
             merged_col_name = col1_name + col2_name
 
         # For each row, concatenate the values from the two columns
-        merged_col_values = []
-        for row_idx in range(len(df)):
-            val1 = str(df.iloc[row_idx, index])
-            val2 = str(df.iloc[row_idx, index + 1])
+        for row in table.rows:
+            val1 = str(row[index])
+            val2 = str(row[index + 1])
 
             # Handle NaN values
             if val1 == "nan":
@@ -353,23 +834,14 @@ def apply_merge(df, details):
 
             # Concatenate the values with a space in between if both have content
             if val1 and val2:
-                merged_val = val1 + " " + val2
+                row[index] = val1 + " " + val2
             else:
-                merged_val = val1 + val2
-
-            merged_col_values.append(merged_val)
-
-        # Create a temporary list of column names
-        new_columns = list(df.columns)
+                row[index] = val1 + val2
 
-        # Remove the second column
-        df.drop(columns=[col2_name], inplace=True)
-
-        # Rename the first column and update its values
-        df.rename(columns={col1_name: merged_col_name}, inplace=True)
-        df[merged_col_name] = merged_col_values
-
-        # print(f"Merged columns {index} ({col1_name}) and {index + 1} ({col2_name}) into {merged_col_name}")
+        # Remove the second column and rename the first
+        table.remove_col(index + 1)
+        table.columns[index] = merged_col_name
+        table.kinds[index] = "object"
 
 
 if __name__ == "__main__":
@@ -383,6 +855,22 @@ if __name__ == "__main__":
     parser.add_argument(
         "-o", "--output", help="Path to save the edited CSV file (optional)"
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes replaying logs in parallel",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Compact each log before replaying it; the edited files are the same",
+    )
+    parser.add_argument(
+        "--index-cache",
+        help="File caching the listing of the CSV folder between runs",
+    )
 
     args = parser.parse_args()
     json_files = glob.glob(os.path.join(args.json_path, "*.json"))
@@ -393,16 +881,40 @@ if __name__ == "__main__":
 
     print(f"Found {len(json_files)} JSON files in {args.json_path}")
 
-    # Process each JSON file
-    for json_file in json_files:
-        print(f"Processing {json_file}...")
-        output_path = os.path.join(
-            args.output, os.path.basename(json_file).split("_")[-1].split(".")[0]
-        )
-        try:
-            process_edits(args.csv_path, json_file, output_path)
-            print(f"Successfully processed {json_file}\n")
-        except Exception as e:
-            print(f"Error processing {json_file}: {str(e)}")
-
-    print("Processing complete.")
+    t0 = time.perf_counter()
+    n_ops = 0
+    index = CsvIndex.load(args.csv_path, args.index_cache)
+    if args.jobs > 1:
+        for report in replay_logs(
+            args.csv_path, json_files, args.output, args.jobs, args.compact, index
+        ):
+            print(f"Processing {report['log']}...")
+            print(report["messages"], end="")
+            n_ops += report["ops"]
+            if report["errors"]:
+                for error in report["errors"]:
+                    print(f"Error processing {report['log']}: {error}")
+                print()
+            else:
+                print(
+                    f"Successfully processed {report['log']}: "
+                    f"{report['files']} files, {report['ops']} ops\n"
+                )
+    else:
+        # Process each JSON file
+        for json_file in json_files:
+            print(f"Processing {json_file}...")
+            output_path = log_output_folder(args.output, json_file)
+            try:
+                n_ops += process_edits(
+                    args.csv_path, json_file, output_path, args.compact, index
+                )
+                print(f"Successfully processed {json_file}\n")
+            except Exception as e:
+                print(f"Error processing {json_file}: {str(e)}")
+
+    elapsed = time.perf_counter() - t0
+    print(
+        f"Processing complete: {n_ops} ops in {elapsed:.1f}s, "
+        f"{n_ops / elapsed if elapsed else 0:.0f} ops/sec"
+    )
@@ -0,0 +1,379 @@
+import argparse
+import glob
+import json
+import os
+
+# Rewrites csv_update edit logs into shorter ones that leave every table as
+# the full log would. Rules that depend on where rows and columns land need
+# the table's shape, which is followed through the log; without it only
+# edits are coalesced.
+
+
+def _is_int(value):
+    return type(value) is int
+
+
+def _is_text(value):
+    return value is None or isinstance(value, str)
+
+
+def _details(instruction):
+    details = instruction.get("details")
+    return details if isinstance(details, dict) else {}
+
+
+def _with_details(instruction, **details):
+    return dict(instruction, details=dict(_details(instruction), **details))
+
+
+def _cell(instruction):
+    # (row, col) of an edit csv_update applies to a single, unaliased cell,
+    # or None
+    if instruction.get("action") != "edit":
+        return None
+    details = _details(instruction)
+    row, col = details.get("row"), details.get("col")
+    if _is_int(row) and _is_int(col) and row >= 1 and col >= 0:
+        return row, col
+    return None
+
+
+def step(instruction, shape):
+    """
+    Shape of a table after csv_update applies an instruction to it.
+
+    Args:
+        instruction (dict): Logged instruction
+        shape (tuple): (rows, columns) before it, or None if unknown
+
+    Returns:
+        tuple: (rows, columns) after it, or None if unknown
+    """
+    if shape is None:
+        return None
+    n_rows, n_cols = shape
+    action = instruction.get("action")
+    details = _details(instruction)
+    index = details.get("index")
+    amount = details.get("amount", 1)
+    if action == "edit":
+        return shape
+    if action == "add_row":
+        index = details.get("index", 0)
+        if not (_is_int(index) and _is_int(amount)):
+            return None
+        if n_cols == 0:
+            return 0, n_cols
+        return n_rows + max(amount, 0), n_cols
+    if action == "remove_row":
+        if not (_is_int(index) and _is_int(amount)):
+            return None
+        start = index - 1
+        if start < 0 or start >= n_rows:
+            return shape
+        return n_rows - max(min(amount, n_rows - start), 0), n_cols
+    if action == "add_col":
+        index = details.get("index", 0)
+        if not (_is_int(index) and _is_int(amount)):
+            return None
+        return n_rows, n_cols + max(amount, 0)
+    if action == "remove_col":
+        if not (_is_int(index) and _is_int(amount)):
+            return None
+        if index >= n_cols:
+            return shape
+        amount = min(amount, n_cols - index)
+        positions = range(n_cols)
+        try:
+            removed = {positions[i] for i in range(index, index + amount)}
+        except IndexError:
+            return None
+        return n_rows, n_cols - len(removed)
+    if action == "merge":
+        if index is None:
+            return shape
+        if not _is_int(index):
+            return None
+        if details.get("isRow", True):
+            if 0 <= index < n_rows - 1:
+                return n_rows - 1, n_cols
+        elif 0 <= index < n_cols - 1:
+            return n_rows, n_cols - 1
+        return shape
+    return shape
+
+
+def is_noop(instruction, shape):
+    # Whether csv_update skips the instruction (after a message) on a table
+    # of this shape
+    n_rows, n_cols = shape
+    action = instruction.get("action")
+    details = _details(instruction)
+    index = details.get("index")
+    amount = details.get("amount", 1)
+    if action == "edit":
+        row, col = details.get("row"), details.get("col")
+        return _is_int(row) and _is_int(col) and (row - 1 >= n_rows or col >= n_cols)
+    if action == "remove_row":
+        return _is_int(index) and (
+            not 1 <= index <= n_rows or (_is_int(amount) and amount <= 0)
+        )
+    if action == "remove_col":
+        return _is_int(index) and (
+            index >= n_cols or (index >= 0 and _is_int(amount) and amount <= 0)
+        )
+    if action in ("add_row", "add_col"):
+        return (
+            _is_int(details.get("index", 0))
+            and _is_int(amount)
+            and amount <= 0
+            and (action == "add_col" or n_cols > 0)
+        )
+    if action == "merge":
+        if index is None:
+            return True
+        if not _is_int(index):
+            return False
+        size = n_rows if details.get("isRow", True) else n_cols
+        return not 0 <= index < size - 1
+    return action not in ("edit", "remove_row", "remove_col", "add_col", "add_row")
+
+
+def coalesce_edits(instr_list):
+    """
+    Fold successive edits of the same cell into the first one, keeping its
+    oldVal and taking the last newVal. Edits of other cells may come in
+    between, anything else ends the run.
+
+    Only text (or null) values are folded: a number set in passing can
+    change the type of its whole column.
+    """
+    out = []
+    # Cell -> position in out of the edit later ones fold into
+    runs = {}
+    for instruction in instr_list:
+        cell = _cell(instruction)
+        if cell is None:
+            # Anything but an edit moves cells; an edit of row 0 (the last
+            # row) or a negative column may hit any cell
+            runs = {}
+            out.append(instruction)
+            continue
+        new_val = _details(instruction).get("newVal")
+        if not _is_text(new_val):
+            runs.pop(cell, None)
+            out.append(instruction)
+            continue
+        if cell in runs:
+            first = runs[cell]
+            out[first] = _with_details(out[first], newVal=new_val)
+            continue
+        runs[cell] = len(out)
+        out.append(instruction)
+    return out
+
+
+def _merge(prev, prev_shape, instruction, textual):
+    """
+    Combine two successive structural instructions.
+
+    Returns:
+        list: Instructions replacing both, or None if they do not combine
+    """
+    n_rows, n_cols = prev_shape
+    action, prev_action = instruction.get("action"), prev.get("action")
+    details, prev_details = _details(instruction), _details(prev)
+    i, a = prev_details.get("index"), prev_details.get("amount", 1)
+    j, b = details.get("index"), details.get("amount", 1)
+    if not all(_is_int(v) for v in (i, a, j, b)) or a < 1 or b < 1:
+        return None
+
+    if prev_action == "add_row" and n_cols > 0 and i >= 1 and j >= 1:
+        start = min(i - 1, n_rows)
+        if action == "add_row":
+            # Both blocks of empty rows end up as one
+            if start <= min(j - 1, n_rows + a) <= start + a:
+                return [_with_details(prev, index=start + 1, amount=a + b)]
+        elif action == "remove_row" and textual:
+            # Adding rows also turns every column to object, which only
+            # matters to edits setting numbers
+            if j - 1 == start and min(b, n_rows + a - start) == a:
+                return []
+    elif prev_action == "remove_row" and action == "remove_row":
+        if 1 <= i <= n_rows and j >= 1:
+            removed = min(a, n_rows - i + 1)
+            left = n_rows - removed
+            if j <= left:
+                more = min(b, left - j + 1)
+                if j <= i <= j + more:
+                    return [_with_details(instruction, amount=removed + more)]
+    elif prev_action == "add_col" and i >= 0 and j >= 0:
+        start = min(i, n_cols)
+        if action == "add_col":
+            if start <= min(j, n_cols + a) <= start + a:
+                return [_with_details(prev, index=start, amount=a + b)]
+        elif action == "remove_col":
+            if j == start and min(b, n_cols + a - start) == a:
+                return []
+    elif prev_action == "remove_col" and action == "remove_col":
+        if 0 <= i < n_cols and j >= 0:
+            removed = min(a, n_cols - i)
+            left = n_cols - removed
+            if j < left:
+                more = min(b, left - j)
+                if j <= i <= j + more:
+                    return [_with_details(instruction, amount=removed + more)]
+    return None
+
+
+def merge_structural(instr_list, shape):
+    """
+    Drop the instructions csv_update would skip on a table of this shape,
+    merge adjacent add_row, remove_row, add_col and remove_col ranges, and
+    cancel an add followed by the remove of exactly the same rows or
+    columns.
+
+    Args:
+        instr_list (list): Instructions of one file, in log order
+        shape (tuple): (rows, columns) of the file before the log
+
+    Returns:
+        list: Rewritten instructions
+    """
+    textual = all(
+        _is_text(_details(instruction).get("newVal"))
+        for instruction in instr_list
+        if instruction.get("action") == "edit"
+    )
+    # (instruction, shape before it)
+    out = []
+    for instruction in instr_list:
+        if shape is not None and is_noop(instruction, shape):
+            continue
+        merged = None
+        if out and shape is not None and out[-1][1] is not None:
+            prev, prev_shape = out[-1]
+            merged = _merge(prev, prev_shape, instruction, textual)
+        if merged is None:
+            out.append((instruction, shape))
+            shape = step(instruction, shape)
+            continue
+        out.pop()
+        shape = prev_shape
+        for new in merged:
+            out.append((new, shape))
+            shape = step(new, shape)
+    return [instruction for instruction, _ in out]
+
+
+def compact_file(instr_list, shape=None):
+    """
+    Rewrite the instructions of one file into a shorter sequence leaving the
+    table as the full sequence would.
+
+    Args:
+        instr_list (list): Instructions of one file, in log order
+        shape (tuple, optional): (rows, columns) of the file as pd.read_csv
+                                 reads it; without it only edits are
+                                 coalesced
+
+    Returns:
+        list: Compacted instructions
+    """
+    while True:
+        compacted = coalesce_edits(instr_list)
+        if shape is not None:
+            compacted = merge_structural(compacted, shape)
+        if len(compacted) == len(instr_list):
+            return compacted
+        instr_list = compacted
+
+
+def compact(instructions, shapes=None):
+    """
+    Compact an edit log file by file, keeping the log order.
+
+    Args:
+        instructions (list): Logged instructions
+        shapes (dict, optional): fileName -> (rows, columns) of its CSV
+
+    Returns:
+        list: Compacted instructions
+    """
+    shapes = shapes or {}
+    # Instructions without a fileName stay where they are
+    positions = {}
+    groups = {}
+    for position, instruction in enumerate(instructions):
+        file_name = instruction.get("fileName")
+        key = file_name if file_name else ("", position)
+        groups.setdefault(key, []).append(instruction)
+        positions.setdefault(key, []).append(position)
+
+    placed = []
+    for key, instr_list in groups.items():
+        compacted = instr_list
+        if isinstance(key, str):
+            compacted = compact_file(instr_list, shapes.get(key))
+            if not compacted:
+                # Keep the file in the log, so it is still written; adding
+                # no columns is silently skipped
+                compacted = [
+                    {
+                        "fileName": key,
+                        "action": "add_col",
+                        "details": {"index": 0, "amount": 0},
+                    }
+                ]
+        # Rewritten instructions take the places of the first ones of the file
+        placed.extend(zip(positions[key], compacted))
+    return [instruction for _, instruction in sorted(placed, key=lambda p: p[0])]
+
+
+if __name__ == "__main__":
+    from src import csv_update
+
+    parser = argparse.ArgumentParser(description="Compact csv_update edit logs")
+    parser.add_argument("json_path", help="Edit log, or a folder of *.json logs")
+    parser.add_argument("-o", "--output", required=True, help="Folder for the logs")
+    parser.add_argument(
+        "--csv-folder",
+        help="Folder of the CSV files the logs apply to; needed to merge and "
+        "cancel row and column operations",
+    )
+
+    args = parser.parse_args()
+    if os.path.isdir(args.json_path):
+        json_files = sorted(glob.glob(os.path.join(args.json_path, "*.json")))
+    else:
+        json_files = [args.json_path]
+    os.makedirs(args.output, exist_ok=True)
+
+    index = csv_update.CsvIndex.load(args.csv_folder) if args.csv_folder else None
+    total_before = total_after = 0
+    for json_file in json_files:
+        try:
+            with open(json_file, "r") as f:
+                instructions = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error reading {json_file}: {e}")
+            continue
+        shapes = {}
+        if index is not None:
+            for file_name in {i.get("fileName") for i in instructions} - {None, ""}:
+                csv_path = index.find(file_name)
+                if csv_path is None:
+                    continue
+                try:
+                    table = csv_update.Table.read_csv(csv_path)
+                except Exception:
+                    continue
+                shapes[file_name] = (len(table.rows), len(table.columns))
+        compacted = compact(instructions, shapes)
+        with open(os.path.join(args.output, os.path.basename(json_file)), "w") as f:
+            json.dump(compacted, f)
+        total_before += len(instructions)
+        total_after += len(compacted)
+        print(f"{json_file}: {len(instructions)} -> {len(compacted)} instructions")
+
+    print(f"Compacted {len(json_files)} logs: {total_before} -> {total_after}")
@@ -0,0 +1,316 @@
+import csv
+import io
+import json
+import os
+import shutil
+import threading
+import time
+
+from src import csv_update
+
+# A filing's edits are kept as an append-only journal.jsonl, one instruction
+# per line as the editor sends them, next to snapshots of its tables:
+# snapshots/000000000000 holds the tables as first uploaded and later ones
+# the tables after the edit of their number. A table replaced whole is
+# journaled as a "replace" entry holding its new text. The tables are
+# rebuilt from the latest snapshot and the journal after it. When the
+# filing is parsed afresh into different tables, both move to archive/<time>/.
+
+SNAPSHOT_DIGITS = 12
+
+
+def read_grid(text):
+    return list(csv.reader(io.StringIO(text, newline="")))
+
+
+def write_grid(grid):
+    out = io.StringIO()
+    csv.writer(out).writerows(
+        ["" if cell is None else cell for cell in row] for row in grid
+    )
+    return out.getvalue()
+
+
+class EditJournal:
+    """
+    Edits to the tables of one filing, appended to a journal on disk.
+
+    Appends are made durable together: a writer whose lines another
+    writer's fsync already covered returns without one. Every
+    snapshot_every edits the tables are written out whole, so rebuilding
+    them replays at most that many edits.
+    """
+
+    def __init__(self, folder, snapshot_every=500):
+        self.folder = folder
+        self.snapshot_every = snapshot_every
+        self.path = os.path.join(folder, "journal.jsonl")
+        self.snapshot_dir = os.path.join(folder, "snapshots")
+        self.archive_dir = os.path.join(folder, "archive")
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        self.seq = self._recover()
+        self._synced = self.seq
+        self._file = open(self.path, "ab")
+        self._snapshot_seq = self._latest_snapshot()[0]
+
+    def _recover(self):
+        # Number of the last edit, dropping a line cut short by a crash
+        seq, end = 0, 0
+        try:
+            with open(self.path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        seq = json.loads(line)["seq"]
+                    except (ValueError, KeyError):
+                        break
+                    end = f.tell()
+        except FileNotFoundError:
+            return 0
+        with open(self.path, "r+b") as f:
+            f.truncate(end)
+        return seq
+
+    def _snapshot_path(self, seq):
+        return os.path.join(self.snapshot_dir, str(seq).zfill(SNAPSHOT_DIGITS))
+
+    def _latest_snapshot(self):
+        # (seq, journal offset) of the newest complete snapshot
+        names = [
+            name
+            for name in os.listdir(self.snapshot_dir)
+            if name.isdigit() and len(name) == SNAPSHOT_DIGITS
+        ]
+        if not names:
+            return 0, 0
+        with open(os.path.join(self.snapshot_dir, max(names), "meta.json")) as f:
+            meta = json.load(f)
+        return meta["seq"], meta["offset"]
+
+    def _write_snapshot(self, seq, offset, tables, previous=None):
+        # tables: filename -> CSV text, or None to reuse previous's file
+        path = self._snapshot_path(seq)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        os.makedirs(tmp_path)
+        for filename, text in tables.items():
+            target = os.path.join(tmp_path, filename)
+            if text is None:
+                try:
+                    os.link(os.path.join(previous, filename), target)
+                except OSError:
+                    shutil.copyfile(os.path.join(previous, filename), target)
+                continue
+            with open(target, "w", newline="", encoding="utf-8") as f:
+                f.write(text)
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump({"seq": seq, "offset": offset, "files": sorted(tables)}, f)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+
+    def base(self):
+        """
+        Returns:
+            dict: filename -> CSV text of the tables as first uploaded, or
+                  None if the journal was never started
+        """
+        path = self._snapshot_path(0)
+        if not os.path.exists(path):
+            return None
+        return self._read_snapshot(path)
+
+    def _read_snapshot(self, path):
+        with open(os.path.join(path, "meta.json")) as f:
+            files = json.load(f)["files"]
+        tables = {}
+        for filename in files:
+            with open(
+                os.path.join(path, filename), "r", newline="", encoding="utf-8"
+            ) as f:
+                tables[filename] = f.read()
+        return tables
+
+    def start(self, tables):
+        """
+        Begin the journal with the tables of a freshly parsed filing, unless
+        it already began with these same tables. An earlier journal and its
+        snapshots are archived.
+
+        Args:
+            tables (dict): filename -> CSV text
+
+        Returns:
+            bool: True if the journal was started afresh, False if its edits
+                  are kept
+        """
+        with self._snapshot_lock, self._lock:
+            if self.base() == tables:
+                return False
+            self._file.close()
+            self._archive()
+            os.makedirs(self.snapshot_dir)
+            self._file = open(self.path, "wb")
+            self.seq = self._synced = self._snapshot_seq = 0
+            self._write_snapshot(0, 0, tables)
+            return True
+
+    def _archive(self):
+        # Move the journal and snapshots aside, unless there is nothing to keep
+        if os.path.exists(self.path) and os.path.getsize(self.path) == 0:
+            os.remove(self.path)
+        if not os.path.exists(self.path) and not os.listdir(self.snapshot_dir):
+            os.rmdir(self.snapshot_dir)
+            return
+        path = os.path.join(self.archive_dir, str(time.time_ns()))
+        os.makedirs(path)
+        if os.path.exists(self.path):
+            os.replace(self.path, os.path.join(path, "journal.jsonl"))
+        os.replace(self.snapshot_dir, os.path.join(path, "snapshots"))
+
+    def append(self, filename, instructions):
+        """
+        Record edits to one table, returning once they are on disk.
+
+        Args:
+            filename (str): Table the edits apply to
+            instructions (list): csv_update instructions, rows counted as
+                                 apply_to_grid counts them
+
+        Returns:
+            int: Number of the last edit
+        """
+        if not instructions:
+            return self.seq
+        with self._lock:
+            lines = []
+            for instruction in instructions:
+                self.seq += 1
+                entry = {
+                    "seq": self.seq,
+                    "fileName": filename,
+                    "action": instruction.get("action"),
+                    "details": instruction.get("details"),
+                }
+                lines.append(json.dumps(entry) + "\n")
+            self._file.write("".join(lines).encode("utf-8"))
+            self._file.flush()
+            seq = self.seq
+        self._sync(seq)
+        if seq - self._snapshot_seq >= self.snapshot_every:
+            self.snapshot()
+        return seq
+
+    def replace(self, filename, text):
+        """
+        Record that a table was replaced whole; edits before it no longer
+        apply to it.
+
+        Args:
+            filename (str): Table replaced
+            text (str): Its new CSV text
+
+        Returns:
+            int: Number of the edit
+        """
+        return self.append(
+            filename, [{"action": "replace", "details": {"content": text}}]
+        )
+
+    def _sync(self, seq):
+        # One fsync covers every line written before it, so writers that
+        # queued behind it have nothing left to sync
+        with self._sync_lock:
+            if self._synced >= seq:
+                return
+            with self._lock:
+                fd, upto = self._file.fileno(), self.seq
+            os.fsync(fd)
+            self._synced = upto
+
+    def entries(self, offset=0):
+        """
+        Journal entries from a byte offset on.
+
+        Yields:
+            tuple: (entry, offset after it)
+        """
+        with self._lock:
+            end = self._file.tell()
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            while f.tell() < end:
+                line = f.readline()
+                yield json.loads(line), f.tell()
+
+    def tables(self):
+        """
+        Rebuild the tables: the latest snapshot with the edits after it.
+
+        Returns:
+            tuple: (seq of the last edit replayed, dict filename -> CSV text)
+        """
+        with self._snapshot_lock:
+            tables, seq, _, _ = self._rebuild()
+        return seq, tables
+
+    def _rebuild(self):
+        snapshot_seq, offset = self._latest_snapshot()
+        path = self._snapshot_path(snapshot_seq)
+        if not os.path.exists(path):
+            return {}, 0, 0, set()
+        tables = self._read_snapshot(path)
+        # Edits of each table, applied together
+        pending = {}
+        seq = snapshot_seq
+        for entry, offset in self.entries(offset):
+            if entry["action"] == "replace":
+                tables[entry["fileName"]] = entry["details"]["content"]
+                pending[entry["fileName"]] = []
+            else:
+                pending.setdefault(entry["fileName"], []).append(entry)
+            seq = entry["seq"]
+        for filename, instructions in pending.items():
+            if not instructions:
+                continue
+            grid = read_grid(tables.get(filename, ""))
+            errors = []
+            grid = csv_update.apply_to_grid(grid, instructions, errors)
+            # An edit that cannot be applied is left out rather than
+            # failing every rebuild after it
+            for entry, e in errors:
+                print(f"Skipping journal entry {entry['seq']} of {filename}: {e}")
+            tables[filename] = write_grid(grid)
+        return tables, seq, offset, set(pending)
+
+    def snapshot(self):
+        """
+        Write the current tables out whole, so later rebuilds start there.
+        Tables not edited since the last snapshot are linked to it.
+        """
+        with self._snapshot_lock:
+            previous = self._snapshot_path(self._latest_snapshot()[0])
+            tables, seq, offset, changed = self._rebuild()
+            if seq == self._snapshot_seq:
+                return
+            self._write_snapshot(
+                seq,
+                offset,
+                {
+                    name: text if name in changed else None
+                    for name, text in tables.items()
+                },
+                previous,
+            )
+            # The first snapshot is kept to tell a re-upload of the filing
+            for name in os.listdir(self.snapshot_dir):
+                if name.isdigit() and 0 < int(name) < seq:
+                    shutil.rmtree(os.path.join(self.snapshot_dir, name))
+            self._snapshot_seq = seq
+
+    def close(self):
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,130 @@
+import codecs
+import re
+
+import chardet
+
+# Filings are decoded without running a detector over the whole file: a byte
+# order mark or a declared charset settles most of them, valid utf-8 the
+# rest, and only undeclared legacy files get a detector run on a sample
+
+DECLARATION_BYTES = 4096
+SAMPLE_BYTES = 64 * 1024
+
+# utf-32 first, as the utf-32-le mark starts with the utf-16-le one
+BOMS = [
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+meta_charset_re = re.compile(
+    rb"""<meta[^>]*?charset\s*=\s*["']?\s*([a-z0-9_.:\-]+)""", re.IGNORECASE
+)
+xml_encoding_re = re.compile(
+    rb"""^\s*<\?xml[^>]*?encoding\s*=\s*["']([a-z0-9_.:\-]+)""", re.IGNORECASE
+)
+# Labels browsers read as windows-1252, which EDGAR's legacy filings are
+# written in whatever they declare
+WINDOWS_1252_LABELS = frozenset(["ascii", "us-ascii", "iso-8859-1", "latin-1"])
+
+
+def bom_encoding(raw):
+    for bom, encoding in BOMS:
+        if raw.startswith(bom):
+            return encoding
+    return None
+
+
+def _codec(label):
+    label = label.decode("ascii", "ignore").strip().lower()
+    if label in WINDOWS_1252_LABELS:
+        return "cp1252"
+    try:
+        return codecs.lookup(label).name
+    except LookupError:
+        return None
+
+
+def declared_encoding(raw):
+    """
+    Charset named by an XML declaration or a <meta> tag near the top of the
+    document.
+
+    Returns:
+        str: Python codec name, or None when nothing usable is declared
+    """
+    head = raw[:DECLARATION_BYTES]
+    m = xml_encoding_re.search(head) or meta_charset_re.search(head)
+    encoding = _codec(m.group(1)) if m else None
+    if encoding and encoding.startswith(("utf-16", "utf-32")):
+        # A declaration readable as ASCII is not in a 16 or 32 bit encoding
+        return "utf-8"
+    return encoding
+
+
+def sniff_encoding(raw, start=0):
+    # Run the detector on SAMPLE_BYTES around `start`, the first byte that is
+    # not utf-8, rather than on the whole file
+    offset = max(start - SAMPLE_BYTES // 2, 0)
+    result = chardet.detect(raw[offset : offset + SAMPLE_BYTES])
+    label = result["encoding"]
+    return _codec(label.encode("ascii")) if label else None
+
+
+def stream_encoding(head):
+    """
+    Encoding of a filing read as a stream, judged from its first bytes only.
+
+    Args:
+        head (bytes): Start of the filing
+
+    Returns:
+        str: Python codec name
+    """
+    encoding = bom_encoding(head) or declared_encoding(head)
+    if encoding:
+        return encoding
+    try:
+        # The last character of the head may be cut short
+        codecs.getincrementaldecoder("utf-8")().decode(head)
+        return "utf-8"
+    except UnicodeDecodeError as e:
+        return sniff_encoding(head, e.start) or "cp1252"
+
+
+def decode_html(raw):
+    """
+    Decode an HTML filing, trying in order its byte order mark, its declared
+    charset, utf-8, and a detector run on a sample of the file.
+
+    Args:
+        raw (bytes): Filing as read from disk or uploaded
+
+    Returns:
+        str: Decoded document; bytes no candidate can decode are replaced
+    """
+    encoding = bom_encoding(raw)
+    if encoding:
+        return raw.decode(encoding, errors="replace")
+
+    encoding = declared_encoding(raw)
+    if encoding:
+        try:
+            return raw.decode(encoding)
+        except UnicodeDecodeError:
+            # Declarations are sometimes wrong; go on guessing
+            pass
+
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError as e:
+        start = e.start
+
+    encoding = sniff_encoding(raw, start)
+    if encoding:
+        try:
+            return raw.decode(encoding)
+        except UnicodeDecodeError:
+            pass
+    return raw.decode("cp1252", errors="replace")
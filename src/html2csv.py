@@ -1,11 +1,18 @@
 import asyncio
+import csv
 import math
-import glob, sys, re
+import glob, io, sys, re
 import warnings
 
 warnings.simplefilter(action="ignore", category=FutureWarning)
 import pandas as pd
-from src import html_parsing
+from src import html_parsing, table_grid
+
+digits_re = re.compile(r"^\d+$")
+record_start_re = re.compile(r"\n(?=[^\s,<]+,<table)")
+footnote_re = re.compile(r"\(\w\)")
+close_paren_re = re.compile(r"\w\)")
+spaces_re = re.compile(r" +")
 
 
 def extract_table_title(p):
@@ -27,123 +34,158 @@ def debug_output(i, p):
         print(p)
 
 
+def iter_records(html):
+    # "tid,<table>...</table>" records of a parse_html output string, split
+    # as iter_parse_html yields them, whatever the tid
+    return record_start_re.split(html.strip())
+
+
+def iter_process(html_content, debug=False, table_map=None):
+    """
+    Normalize the tables of parse_html output one at a time.
+
+    Args:
+        html_content: parse_html output, as a string or an iterable of its
+                      records (e.g. html_parsing.iter_parse_html)
+        debug (bool): Treat html_content as a raw filing and parse it first
+        table_map (list, optional): Extended with the numeric tid of every
+                                    record read, including those of dropped
+                                    tables
+
+    Yields:
+        tuple: (tid, csv) for every table kept; tid is None for a record
+               whose tid is not a number (such as "unknown"), whose tables
+               are read but left out of table_map, as pd.read_html read them
+    """
+    if debug:
+        html_content = html_parsing.iter_parse_html(html_content)
+    if isinstance(html_content, str):
+        html_content = iter_records(html_content)
+    i = -1
+    for record in html_content:
+        tid = record.split(",")[0]
+        tid = int(tid) if digits_re.match(tid) else None
+        if table_map is not None and tid is not None:
+            table_map.append(tid)
+        try:
+            tables = table_grid.read_tables(io.StringIO(record))
+        except ValueError:
+            # No table in the record
+            continue
+        for columns, rows in tables:
+            i += 1
+            csv_output = normalize_table(i, columns, rows)
+            if csv_output is not None:
+                yield tid, csv_output
+
+
 def process(html_content, debug=False):
-    html = html_parsing.parse_html(html_content) if debug else html_content
-    rows = html.strip().split("\n")
     table_map = [0]
-    for r in rows:
-        tid = r.split(",")[0]
-        if re.compile(r"^\d+$").match(tid):
-            table_map.append(int(tid))
-
-    tables = pd.read_html(html, flavor="lxml", displayed_only=False)
+    csv_outputs = [
+        csv_output for _, csv_output in iter_process(html_content, debug, table_map)
+    ]
+    return csv_outputs, table_map
 
-    csv_outputs = []
-    for i, p in enumerate(tables):
-        if (p.shape[0] < 2) or (p.shape[1] < 2):
-            continue
 
-        # debug_output(i, p)
-
-        p.dropna(how="all", axis=1, inplace=True)
-        p.dropna(how="all", axis=0, inplace=True)
-        p = p.fillna("")
-
-        # debug_output(i, p)
-
-        allow_empty = True
-        flag_st = 1
-        for r in range(p.shape[0]):
-            offset = 1 if p.iat[r, 0] else 0
-            for c in range(1, p.shape[1]):
-                p.iat[r, c] = str(p.iat[r, c]).replace("$", "")
-                if p.iat[r, c][:1] == ")":
-                    p.iat[r, c - 1] += p.iat[r, c]
-                    p.iat[r, c] = ""
-                if p.iat[r, c][:1] == "%":
-                    p.iat[r, c - 1] += p.iat[r, c]
-                    p.iat[r, c] = ""
-                if p.iat[r, c] == "–":
-                    if c + 1 < p.shape[1]:
-                        if not p.iat[r - 1, c] and flag_st <= c - 2:
-                            it = r - 1
-                            flag_st = c
-                            while it > 0:
-                                if p.iat[it, c] or not p.iat[it, c + 1]:
-                                    break
-                                p.iat[it, c - 1] += "- " + str(p.iat[it, c + 1])
-                                p.iat[it, c] = ""
-                                p.iat[it, c + 1] = ""
-                                it -= 1
-                        p.iat[r, c - 1] += str(" - ")
-                        p.iat[r, c - 1] += str(p.iat[r, c + 1])
-                        p.iat[r, c] = ""
-                        p.iat[r, c + 1] = ""
-                    else:
-                        p.iat[r, c - 1] += p.iat[r, c]
-                        p.iat[r, c] = ""
-                if ".0" in p.iat[r, c][-2:]:
-                    p.iat[r, c] = p.iat[r, c].replace(".0", "")
-                if "( " in p.iat[r, c]:
-                    p.iat[r, c] = p.iat[r, c].replace("( ", "(")
-                if re.compile(r"^\d+$").match(
-                    p.iat[r, c].replace("(", "").replace(")", "").replace(",", "")
-                ):
-                    p.iat[r, c] = p.iat[r, c].replace(",", "")
-                if re.compile(r"\(\w\)").match(p.iat[r, c]):
-                    p.iat[r, c - 1] += p.iat[r, c]
-                    p.iat[r, c] = ""
+def normalize_table(i, columns, rows):
+    if (len(rows) < 2) or (len(columns) < 2):
+        return None
+
+    columns, rows, _ = table_grid.drop_empty(columns, rows)
+    # Each cell keeps its column's type, so ints of column 0, which is never
+    # cleaned of ".0", still print as ints
+    rows = [["" if cell is None else cell for cell in row] for row in rows]
+
+    n_cols = len(columns)
+    flag_st = 1
+    for r, row in enumerate(rows):
+        offset = 1 if row[0] else 0
+        for c in range(1, n_cols):
+            cell = row[c] = str(row[c]).replace("$", "")
+            if cell[:1] == ")" or cell[:1] == "%":
+                row[c - 1] += cell
+                cell = row[c] = ""
+            if cell == "–":
+                if c + 1 < n_cols:
+                    if not rows[r - 1][c] and flag_st <= c - 2:
+                        it = r - 1
+                        flag_st = c
+                        while it > 0:
+                            prev = rows[it]
+                            if prev[c] or not prev[c + 1]:
+                                break
+                            prev[c - 1] += "- " + str(prev[c + 1])
+                            prev[c] = ""
+                            prev[c + 1] = ""
+                            it -= 1
+                    row[c - 1] += " - " + str(row[c + 1])
+                    row[c + 1] = ""
                 else:
-                    if re.compile(r"\w\)").match(p.iat[r, c]) and c + 1 < p.shape[1]:
-                        p.iat[r, c] += " " + p.iat[r, c + 1]
-                        for it in range(c + 1, p.shape[1] - 1):
-                            p.iat[r, it] = p.iat[r, it + 1]
-                        p.iat[r, p.shape[1] - 1] = ""
-                if p.iat[r, c] and offset == 0:
-                    offset = c + 1
-
-        # debug_output(i, p)
-
-        p.replace("", float("NaN"), inplace=True)
-        p.dropna(how="all", axis=1, inplace=True)
-        p.replace(float("NaN"), "", inplace=True)
-        if (p.shape[0] < 2) or (p.shape[1] < 2):
+                    row[c - 1] += cell
+                cell = row[c] = ""
+            if cell[-2:] == ".0":
+                cell = cell.replace(".0", "")
+            if "( " in cell:
+                cell = cell.replace("( ", "(")
+            if digits_re.match(cell.replace("(", "").replace(")", "").replace(",", "")):
+                cell = cell.replace(",", "")
+            row[c] = cell
+            if footnote_re.match(cell):
+                row[c - 1] += cell
+                cell = row[c] = ""
+            elif close_paren_re.match(cell) and c + 1 < n_cols:
+                cell = row[c] = cell + " " + row[c + 1]
+                row[c + 1 : n_cols - 1] = row[c + 2 : n_cols]
+                row[n_cols - 1] = ""
+            if cell and offset == 0:
+                offset = c + 1
+
+    # debug_output(i, p)
+
+    keep = [c for c in range(n_cols) if any(row[c] != "" for row in rows)]
+    if len(rows) < 2 or len(keep) < 2:
+        return None
+    if len(keep) < n_cols:
+        columns = [columns[c] for c in keep]
+        rows = [[row[c] for c in keep] for row in rows]
+        n_cols = len(keep)
+
+    for r in range(3):
+        if r >= len(rows) or (rows[r][0] and r > 0):
             continue
-
-        for r in range(3):
-            if r >= p.shape[0] or (p.iat[r, 0] and r > 0):
-                continue
-            values = []
-            for c in range(offset, p.shape[1]):
-                if p.iat[r, c]:
-                    values.append(p.iat[r, c])
-            for c in range(offset, p.shape[1]):
-                vid = int(math.floor((c - 1.0) * len(values) / (p.shape[1] - 1)))
-                if len(values):
-                    p.iat[r, c] = values[vid]
-
-        # debug_output(i, p)
-
-        c = 0
-        while c < p.shape[1]:
-            isEmpty = True
-            for r in range(3, p.shape[0]):
-                if p.iat[r, c]:
-                    isEmpty = False
-            if isEmpty and p.shape[0] > 3:
-                p.drop(columns=p.columns[c], inplace=True)
-            else:
-                c += 1
-
-        # debug_output(i, p)
-        # print(table_map[i])
-
-        csv_output = p.to_csv(index=False).replace("&nbsp;", " ")
-        csv_output = re.sub(r" +", " ", csv_output)
-        csv_lines = csv_output.split("\n")
-        csv_outputs.append("\n".join(csv_lines[1:-1]))
-
-    return csv_outputs, table_map
+        row = rows[r]
+        values = [row[c] for c in range(offset, n_cols) if row[c]]
+        if values:
+            for c in range(offset, n_cols):
+                row[c] = values[int(math.floor((c - 1.0) * len(values) / (n_cols - 1)))]
+
+    # debug_output(i, p)
+
+    if len(rows) > 3:
+        # Dropping a column drops every column with the same label
+        empty = {
+            columns[c] for c in range(n_cols) if not any(row[c] for row in rows[3:])
+        }
+        keep = [c for c in range(n_cols) if columns[c] not in empty]
+        if len(keep) < n_cols:
+            columns = [columns[c] for c in keep]
+            rows = [[row[c] for c in keep] for row in rows]
+
+    # debug_output(i, p)
+    # print(table_map[i])
+
+    # Written as DataFrame.to_csv(index=False) writes the cells, without
+    # the header line and the last line break; a header of several rows
+    # keeps all but its first
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    if columns and isinstance(columns[0], tuple):
+        writer.writerows(
+            [label[level] for label in columns] for level in range(1, len(columns[0]))
+        )
+    writer.writerows(rows)
+    csv_output = out.getvalue()[:-1].replace("&nbsp;", " ")
+    return spaces_re.sub(" ", csv_output)
 
 
 if __name__ == "__main__":
@@ -1,22 +1,21 @@
 import asyncio
 import math
-import glob, sys
+import glob, io, re, sys
 import warnings
 
 warnings.simplefilter(action="ignore", category=FutureWarning)
 import pandas as pd
+from lxml.etree import XMLSyntaxError
+from src import table_grid
 
 # pd.set_option('future.no_silent_downcasting', True)
 
 
 # Note: One HTML at a time
-def extract_table_title(p):
+def extract_table_title(rows):
     lst = []
-    for r in range(p.shape[0]):
-        lst0 = []
-        for c in range(p.shape[1]):
-            if p.iat[r, c]:
-                lst0.append(p.iat[r, c])
+    for row in rows:
+        lst0 = [cell for cell in row if cell]
         if len(lst0) == 1 and ("ended" not in str(lst0[0]).lower()):
             lst.append(str(lst0[0]))
         else:
@@ -24,74 +23,131 @@ def extract_table_title(p):
     return lst
 
 
+def read_table_rows(html):
+    # Cell texts of the table as process() reads them, or None for markup the
+    # layout check does not model (th/thead/tfoot, nested or missing tables)
+    try:
+        root = table_grid.parse_document(io.StringIO(html))
+    except XMLSyntaxError:
+        return None
+    tables = root.xpath("//table")
+    if len(tables) != 1 or not re.search(".", "".join(tables[0].itertext())):
+        return None
+    table = tables[0]
+    if table.xpath(".//th|.//thead|.//tfoot"):
+        return None
+    try:
+        return table_grid.expand_rows(table_grid.body_rows(table))
+    except ValueError:
+        return None
+
+
+def is_layout_table(html):
+    # True only for tables process() is certain to reject, decided from the
+    # markup alone: fewer than 2 rows or columns, fewer than 2 non-empty rows,
+    # or only rows with a single non-empty cell, which all become titles
+    rows = read_table_rows(html)
+    if not rows:
+        return False
+    n_cols = max(len(texts) for texts in rows)
+    if any(len(texts) != n_cols for texts in rows):
+        # Padded ragged rows change how the header is inferred
+        return False
+    if n_cols < 2:
+        # Blank single-cell rows are skipped when the table is read
+        rows = [texts for texts in rows if texts and texts[0]]
+    if not rows:
+        # No table is read and process() raises; leave it to process()
+        return False
+    if len(rows) < 2 or n_cols < 2:
+        return True
+
+    if any(text.replace("$", "")[:1] in (")", "%") for texts in rows for text in texts):
+        # process() can fail merging these cells into a numeric neighbour
+        return False
+    filled = [[text for text in texts if text] for texts in rows]
+    filled = [texts for texts in filled if texts]
+    if len(filled) < 2:
+        return True
+    return all(
+        len(texts) == 1
+        and "ended" not in texts[0].lower()
+        and texts[0].lower() != "false"
+        and any(ch.isalpha() and ch not in "eE" for ch in texts[0])
+        for texts in filled
+    )
+
+
 def process(html, tid=0):
-    # p = pd.read_html(html, flavor='bs4')[0]
-    p = pd.read_html(html, flavor="lxml", displayed_only=False)[0]
-    if (p.shape[0] < 2) or (p.shape[1] < 2):
+    # Cells are plain lists; a DataFrame is only built for to_markdown
+    columns, rows = table_grid.read_tables(html)[0]
+    if (len(rows) < 2) or (len(columns) < 2):
         return None
-    p.dropna(how="all", axis=1, inplace=True)
-    p.dropna(how="all", axis=0, inplace=True)
-    p = p.fillna("")
-    lst = extract_table_title(p)
-    p = p[len(lst) :]
-    p.replace("", float("NaN"), inplace=True)
-    p.dropna(how="all", axis=1, inplace=True)
-    p.dropna(how="all", axis=0, inplace=True)
-    p.replace(float("NaN"), "", inplace=True)
+    columns, rows, index = table_grid.drop_empty(columns, rows)
+    rows = [["" if cell is None else cell for cell in row] for row in rows]
+    lst = extract_table_title(rows)
+    rows = rows[len(lst) :]
+    index = index[len(lst) :]
+    columns, rows, index = table_grid.drop_empty(columns, rows, index, empty="")
 
     # m = p.to_markdown()
     # print(m)
+    n_cols = len(columns)
     allow_empty = True
-    for r in range(p.shape[0]):
-        for c in range(1, p.shape[1]):
-            p.iat[r, c] = str(p.iat[r, c]).replace("$", "")
-            if p.iat[r, c][:1] == ")":
-                p.iat[r, c - 1] += p.iat[r, c]
-                p.iat[r, c] = ""
-            if p.iat[r, c][:1] == "%":
-                p.iat[r, c - 1] += p.iat[r, c]
-                p.iat[r, c] = ""
-
-        if r == 0 or (not p.iat[r, 0] and allow_empty):
+    for r, row in enumerate(rows):
+        for c in range(1, n_cols):
+            row[c] = str(row[c]).replace("$", "")
+            if row[c][:1] == ")":
+                row[c - 1] += row[c]
+                row[c] = ""
+            if row[c][:1] == "%":
+                row[c - 1] += row[c]
+                row[c] = ""
+
+        if r == 0 or (not row[0] and allow_empty):
             offset = 1
         else:
             allow_empty = False
             offset = 0
 
         values = []
-        for c in range(offset, p.shape[1]):
-            if p.iat[r, c]:
-                values.append(str(p.iat[r, c]))
-        for c in range(offset, p.shape[1]):
+        for c in range(offset, n_cols):
+            if row[c]:
+                values.append(str(row[c]))
+        for c in range(offset, n_cols):
             if values:
                 v = values.pop(0)
                 if ".0" in v[-2:]:
                     v = v.replace(".0", "")
-                p.iat[r, c] = v
+                row[c] = v
             else:
-                p.iat[r, c] = ""
+                row[c] = ""
 
-    p.replace("", float("NaN"), inplace=True)
-    p.dropna(how="all", axis=1, inplace=True)
-    p.replace(float("NaN"), "", inplace=True)
-    if (p.shape[0] < 2) or (p.shape[1] < 2):
+    keep = [c for c in range(n_cols) if any(row[c] != "" for row in rows)]
+    if len(keep) < n_cols:
+        columns = [columns[c] for c in keep]
+        rows = [[row[c] for c in keep] for row in rows]
+    n_cols = len(columns)
+    if (len(rows) < 2) or (n_cols < 2):
         return None
 
     for r in range(3):
-        if r >= p.shape[0] or (p.iat[r, 0] and r > 0):
+        if r >= len(rows) or (rows[r][0] and r > 0):
             continue
+        row = rows[r]
         values = []
-        for c in range(1, p.shape[1]):
-            if p.iat[r, c]:
-                values.append(p.iat[r, c])
-        for c in range(1, p.shape[1]):
-            vid = int(math.floor((c - 1.0) * len(values) / (p.shape[1] - 1)))
+        for c in range(1, n_cols):
+            if row[c]:
+                values.append(row[c])
+        for c in range(1, n_cols):
+            vid = int(math.floor((c - 1.0) * len(values) / (n_cols - 1)))
             if len(values):
-                p.iat[r, c] = values[vid]
+                row[c] = values[vid]
 
     # new_header = p.iloc[0]
     # p = p[1:]
     # p.columns = new_header
+    p = pd.DataFrame(rows, index=index, columns=pd.Index(columns), dtype=object)
     m = "\n".join(lst) + "\n" if len(lst) else ""
     m += '<markdown tid="' + str(tid) + '">\n' + p.to_markdown() + "\n</markdown>"
     return m
@@ -8,9 +8,8 @@ from markdownify import markdownify as md
 from unstructured.documents.elements import Title, Table
 from unstructured.cleaners.core import clean_extra_whitespace
 from multiprocessing import Pool
-from src import html2md
+from src import css_style, encoding, html2md
 from copy import copy
-import chardet
 
 
 def dict_sort(dict):
@@ -19,10 +18,7 @@ def dict_sort(dict):
 
 def read_html(file_path):
     with open(file_path, "rb") as file:
-        rawdata = file.read()
-        result = chardet.detect(rawdata)
-        encoding = result["encoding"]
-        return rawdata.decode(encoding)
+        return encoding.decode_html(file.read())
 
 
 def write_csv(file_path, data):
@@ -31,24 +27,8 @@ def write_csv(file_path, data):
         writer.writerows(data)
 
 
-def get_pstyle_pt(soup, style, loc):
-    s = soup.p["style"].strip(";").split(";")
-    for item in s:
-        if not style in item:
-            continue
-        pt_values = re.findall(r"([\d.]+)pt", item)
-        if pt_values and loc < len(pt_values):
-            return float(pt_values[loc])
-    return -1
-
-
-def get_pstyle_attr(soup, attr):
-    s = soup.p["style"].strip(";").split(";")
-    for item in s:
-        if not attr in item:
-            continue
-        return str(item).split(":")[1].strip()
-    return None
+digit_comma_re = re.compile(r"(?<=\d),(?=\d)")
+footnote_re = re.compile(r"\(.\)")
 
 
 def parse(file_path, output_path, type="markdown"):
@@ -57,40 +37,38 @@ def parse(file_path, output_path, type="markdown"):
 
     # find the indent of each table
     for table_idx, table in enumerate(tables):
-        rows = BeautifulSoup(str(table), "html.parser").find_all("tr")
+        rows = table.find_all("tr")
         table_contents = []
         indents_pt = []
         row_ignored = []
         for i, row in enumerate(rows):
-            items = BeautifulSoup(str(row), "html.parser").find_all("td")
+            items = row.find_all("td")
             table_contents.append([])
             indents_pt.append([])
             for item in items:
                 # save contents
                 item_str = " ".join(item.stripped_strings).replace("&nbsp;", " ")
                 item_str = item_str.replace("( ", "(")
-                item_str = re.sub(r"(?<=\d),(?=\d)", "", item_str)
+                item_str = digit_comma_re.sub("", item_str)
                 item_str = clean_extra_whitespace(item_str)
 
                 if not item.find("p"):
                     table_contents[i].append(item_str)
                     continue
+                style = css_style.parse_style(item.p["style"])
 
                 # save bold/italic
                 if item_str != "":
-                    if get_pstyle_attr(item, "text-transform") == "uppercase":
+                    if style.transform == "uppercase":
                         item_str = item_str.upper()
-                    elif get_pstyle_attr(item, "text-transform") == "lowercase":
+                    elif style.transform == "lowercase":
                         item_str = item_str.lower()
-                    if get_pstyle_attr(item, "font-weight") == "bold":
+                    if style.weight == "bold":
                         item_str = "**" + item_str + "**"
-                    if get_pstyle_attr(item, "font-style") == "italic":
+                    if style.italic:
                         item_str = "*" + item_str + "*"
 
-                if (
-                    get_pstyle_attr(item, "text-align") != "right"
-                    and get_pstyle_attr(item, "text-align") != "center"
-                ):
+                if style.align != "right" and style.align != "center":
                     table_contents[i].append(item_str)
 
                 if item.get("colspan") is not None:
@@ -99,30 +77,11 @@ def parse(file_path, output_path, type="markdown"):
                         table_contents[i].append(item_str)
                         indents_pt[i].append(0.0)
 
-                if (
-                    get_pstyle_attr(item, "text-align") == "right"
-                    or get_pstyle_attr(item, "text-align") == "center"
-                ):
+                if style.align == "right" or style.align == "center":
                     table_contents[i].append(item_str)
 
-                indents_pt[i].append(0.0)
-                j = len(indents_pt[i]) - 1
-
                 # save indent(pt)
-                if get_pstyle_pt(item, "margin", -1) != -1:
-                    indents_pt[i][j] = get_pstyle_pt(item, "margin", -1)
-                if get_pstyle_pt(item, "margin-left", -1) != -1:
-                    indents_pt[i][j] = get_pstyle_pt(item, "margin-left", -1)
-
-                if get_pstyle_attr(item, "text-indent") is not None:
-                    txt_indent = float(
-                        get_pstyle_attr(item, "text-indent").split(":")[-1].strip()[:-2]
-                    )
-                    if indents_pt[i][j] != 0.0:
-                        # e.g. "margin-left: 24pt, text-indent: -12pt"
-                        indents_pt[i][j] += txt_indent
-                    else:
-                        indents_pt[i][j] = txt_indent
+                indents_pt[i].append(style.indent_pt)
 
         indents_pt = list(map(list, zip(*indents_pt)))  # transposed
 
@@ -158,7 +117,7 @@ def parse(file_path, output_path, type="markdown"):
                     ) + table_contents[i][j].lstrip("*")
                     table_contents[i][j] = ""
                 # (a) case
-                if re.match(r"\(.\)", table_contents[i][j].strip(" ").strip("*")):
+                if footnote_re.match(table_contents[i][j].strip(" ").strip("*")):
                     starcount = 0
                     if table_contents[i][j - 1][0] == "*":
                         starcount += 1
@@ -190,7 +149,7 @@ def parse(file_path, output_path, type="markdown"):
         if mask.any():
             empty_cols = df[mask].isna().all(axis=0)
             df = df.loc[:, ~empty_cols]
-        empty_rows = df.isna().all·(axis=1)
+        empty_rows = df.isna().all(axis=1)
         df = df[~empty_rows]
         table_contents = df.replace(float("NaN"), "").to_numpy().tolist()
 
@@ -200,7 +159,7 @@ def parse(file_path, output_path, type="markdown"):
         if (
             len(table_contents) == 1
             and table_idx > 0
-            and re.match(r"\(.\)", table_contents[0][0])
+            and footnote_re.match(table_contents[0][0])
         ):
             prev_table_contents = prev_table_contents + table_contents
         else:
@@ -1,17 +1,25 @@
 from unstructured.documents.html import HTMLDocument
 from unstructured.nlp.partition import is_possible_title
 import re, csv, os, multiprocessing, sys, math
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from functools import lru_cache
 import pandas as pd
 import io
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, Tag
 from markdownify import markdownify as md
 from unstructured.documents.elements import Title, Table
 from unstructured.cleaners.core import clean_extra_whitespace
 from multiprocessing import Pool
-from src import html2md
+from src import css_style, html2md
 from copy import copy
 import chardet
 
+# Part of every parse_cache key. It must change with any change to what
+# parse_html or html2csv return (including html2md, table_grid and the
+# other modules they call), or the cache keeps serving the older tables.
+PARSER_VERSION = "4"
+
 invalid_tags = [("<ix:header", "</ix:header>")]
 remove_tags = [
     ("<ix:nonNumeric", ">"),
@@ -19,6 +27,9 @@ remove_tags = [
     ("<ix:continuation", ">"),
     ("</ix:continuation", ">"),
 ]
+table_row_re = re.compile(r"<table|<tr", re.IGNORECASE)
+text_run_re = re.compile(r">(?=([^<]*))")
+chunk_size = 1 << 16
 
 
 def match_item_title(ptext, rtitle, title):
@@ -44,211 +55,216 @@ def match_item_title(ptext, rtitle, title):
     return "Item" if "item" in title else None
 
 
-def is_10k_item_title(str1, str2):
-    str1 = str1.lower().replace(" ", "")
-    str2 = str2.lower().replace(" ", "")
-    if "continued" in str1[-10:] or "continued" in str2[-10:]:
+# Item title rules, evaluated on text lowercased with spaces removed.
+# Each rule is (item, order, spec) or (item, order, spec for the title,
+# spec for the following element's text). A spec is clauses joined by " | "
+# (any may match) of space-separated terms (all must match):
+#   needle       needle anywhere in the text
+#   needle:N     needle in the first N characters (a negative N means last)
+#   !needle      needle not in the text
+#   needle~s:N   needle in the first N characters after removing every "s"
+# Groups are tried in order, each on the title first and then on the next
+# text. A form's "skip" spec rejects the pair when either text matches it.
+ITEM_TITLE_RULES = {
+    "10-K": {
+        "skip": "continued:-10",
+        "groups": [
+            [
+                ("1", 0, "business:20"),
+                ("1A", 1, "risk:15 !parti"),
+                ("1B", 2, "unresolved:20 !parti"),
+                ("1C", 3, "cybersecurity:30 !parti", "cybersecurity:25 !parti"),
+                ("2", 4, "properties:25 !parti"),
+                ("3", 5, "legalproceedings:25 !parti"),
+                ("4", 6, "min:25 safety:25 !parti"),
+                ("4", 6, "submission:25 !parti"),
+                ("4", 6, "executiveofficers:25 !parti"),
+                ("5", 7, "marketfor:25"),
+                ("5", 7, "marketprice:25"),
+                (
+                    "6",
+                    8,
+                    "selectedfinancial~consolidated:50 !part",
+                    "selectedfinancial~consolidated:50 !partii",
+                ),
+                ("6", 8, "reserved:30 !partii"),
+                ("7", 9, "management sdiscussion:100 !partii"),
+                (
+                    "7A",
+                    10,
+                    "quantitativeandqualitative:40 !partii"
+                    " | qualitativeandquantitative:40 !partii",
+                ),
+                (
+                    "8",
+                    11,
+                    "financialstatements:30 !partii",
+                    "financialstatement:30 !partii",
+                ),
+                ("9", 12, "changesinanddisagreements:35 !partii"),
+                ("9A", 13, "controlsandprocedures:30 !partii"),
+                ("9B", 14, "otherinfo:20 !partii"),
+                ("9C", 15, "disclosureregarding:40 !partii"),
+                ("10", 16, "directors:50 executive:50 | trustees:50 executive:50"),
+                ("11", 17, "executivecompensation:35 !partiii"),
+                ("12", 18, "securityownership:30 !partiii"),
+                ("13", 19, "certainrelationships:30 !partiii"),
+                ("14", 20, "principala:25 !partiii"),
+            ]
+        ],
+    },
+    "10-Q": {
+        "skip": "",
+        "groups": [
+            [
+                ### Item 1 can sometimes go behind item 2-4
+                ("1.1", 4, "financialstatement~condensed~consolidated:30"),
+                ("1.2", 4, "management sdiscussion:40"),
+                (
+                    "1.3",
+                    4,
+                    "quantitativeandqualitative:35 | qualitativeandquantitative:35",
+                ),
+                ("1.4", 4, "controlsandprocedures:30 | controlsprocedures:30"),
+            ],
+            [
+                ("2.1", 5, "legalproceedings:25"),
+                ("2.1A", 6, "riskfactors~legal:20"),
+                ("2.2", 7, "useofproceeds:70 | unregisteredsales:70 | repurchase:40"),
+                ("2.3", 8, "defaults"),
+                ("2.4", 9, "submission:20 | minesafety:20 | reserved:40"),
+                ("2.5", 10, "!part otherinformation:25 | otheritems:25"),
+            ],
+        ],
+    },
+}
+
+
+def _parse_term(term):
+    # "!needle~strip:window" -> (scanner key, needle, window, negate)
+    negate = term.startswith("!")
+    needle, _, window = term.lstrip("!").partition(":")
+    needle, *strips = needle.split("~")
+    window = int(window) if window else None
+    region = "all" if window is None else ("head" if window > 0 else "tail")
+    return (tuple(strips), region), needle, window, negate
+
+
+def _parse_spec(spec):
+    return [
+        [_parse_term(term) for term in clause.split()]
+        for clause in spec.split("|")
+        if clause.strip()
+    ]
+
+
+@lru_cache(maxsize=None)
+def compile_item_title_rules(form):
+    # Compiles ITEM_TITLE_RULES[form] once. Every (strip, region) pair gets
+    # one regex over all of its needles: a lookahead at each position that
+    # captures the longest needle starting there. Any shorter needle
+    # starting at the same position is a prefix of it, so one scan yields
+    # the first and last position of every needle.
+    table = ITEM_TITLE_RULES[form]
+    skip = _parse_spec(table.get("skip", ""))
+    groups = [
+        [
+            (item, order, _parse_spec(specs[0]), _parse_spec(specs[-1]))
+            for item, order, *specs in group
+        ]
+        for group in table["groups"]
+    ]
+
+    terms = [
+        term
+        for clauses in [skip]
+        + [rule[2] for group in groups for rule in group]
+        + [rule[3] for group in groups for rule in group]
+        for clause in clauses
+        for term in clause
+    ]
+    scanners = {}
+    for key, needle, window, _ in terms:
+        needles, size = scanners.get(key, (set(), 0))
+        needles.add(needle)
+        scanners[key] = (needles, max(size, abs(window or 0)))
+    for key, (needles, size) in scanners.items():
+        ordered = sorted(needles, key=len, reverse=True)
+        pattern = re.compile("(?=(" + "|".join(map(re.escape, ordered)) + "))")
+        prefixes = {n: [m for m in ordered if n.startswith(m)] for n in ordered}
+        scanners[key] = (pattern, prefixes, size)
+    return skip, groups, scanners
+
+
+@lru_cache(maxsize=4096)
+def _scan_title(form, text, key):
+    # Positions of every needle of one scanner in the normalized text
+    strips, region = key
+    pattern, prefixes, size = compile_item_title_rules(form)[2][key]
+    s = text.lower().replace(" ", "")
+    for strip in strips:
+        s = s.replace(strip, "")
+    start = 0
+    if region == "head":
+        s = s[:size]
+    elif region == "tail":
+        start = max(len(s) - size, 0)
+    found = {}
+    for m in pattern.finditer(s, start):
+        for needle in prefixes[m.group(1)]:
+            found.setdefault(needle, [m.start(), m.start()])[1] = m.start()
+    return len(s), found
+
+
+def _match_spec(form, text, clauses):
+    for clause in clauses:
+        for key, needle, window, negate in clause:
+            length, found = _scan_title(form, text, key)
+            hit = found.get(needle)
+            if hit is not None and window is not None:
+                if window > 0:
+                    hit = hit if hit[0] + len(needle) <= window else None
+                else:
+                    hit = hit if hit[1] >= length + window else None
+            if (hit is None) != negate:
+                break
+        else:
+            return True
+    return False
+
+
+def _match_groups(form, groups, str1, str2):
+    for group in groups:
+        for text, spec in ((str1, 2), (str2, 3)):
+            for rule in group:
+                if _match_spec(form, text, rule[spec]):
+                    return rule[0], rule[1]
+    return None
+
+
+def classify_item_title(form, str1, str2):
+    # (item, order) for a title text and the text of the element after it,
+    # or None if no rule of the form's table matches
+    if form not in ITEM_TITLE_RULES:
         return None
-    if "business" in str1[:20]:
-        return "1", 0
-    if "risk" in str1[:15] and "parti" not in str1:
-        return "1A", 1
-    if "unresolved" in str1[:20] and "parti" not in str1:
-        return ("1B", 2)
-    if "cybersecurity" in str1[:30] and "parti" not in str1:
-        return ("1C", 3)
-    if "properties" in str1[:25] and "parti" not in str1:
-        return ("2", 4)
-    if "legalproceedings" in str1[:25] and "parti" not in str1:
-        return ("3", 5)
-    if "min" in str1[:25] and "safety" in str1[:25] and "parti" not in str1:
-        return ("4", 6)
-    if "submission" in str1[:25] and "parti" not in str1:
-        return ("4", 6)
-    if "executiveofficers" in str1[:25] and "parti" not in str1:
-        return ("4", 6)
-    if "marketfor" in str1[:25]:
-        return ("5", 7)
-    if "marketprice" in str1[:25]:
-        return ("5", 7)
-    if (
-        "selectedfinancial" in str1.replace("consolidated", "")[:50]
-        and "part" not in str1
-    ):
-        return ("6", 8)
-    if "reserved" in str1[:30] and "partii" not in str1:
-        return ("6", 8)
-    if ("management" in str1 and "sdiscussion" in str1[:100]) and "partii" not in str1:
-        return ("7", 9)
-    if (
-        "quantitativeandqualitative" in str1[:40]
-        or "qualitativeandquantitative" in str1[:40]
-    ) and "partii" not in str1:
-        return ("7A", 10)
-    if "financialstatements" in str1[:30] and "partii" not in str1:
-        return ("8", 11)
-    if "changesinanddisagreements" in str1[:35] and "partii" not in str1:
-        return ("9", 12)
-    if "controlsandprocedures" in str1[:30] and "partii" not in str1:
-        return ("9A", 13)
-    if "otherinfo" in str1[:20] and "partii" not in str1:
-        return ("9B", 14)
-    if "disclosureregarding" in str1[:40] and "partii" not in str1:
-        return ("9C", 15)
-    if (
-        ("directors" in str1[:50]) or ("trustees" in str1[:50])
-    ) and "executive" in str1[:50]:
-        return ("10", 16)
-    if "executivecompensation" in str1[:35] and "partiii" not in str1:
-        return ("11", 17)
-    if "securityownership" in str1[:30] and "partiii" not in str1:
-        return ("12", 18)
-    if "certainrelationships" in str1[:30] and "partiii" not in str1:
-        return ("13", 19)
-    if "principala" in str1[:25] and "partiii" not in str1:
-        return ("14", 20)
-    if "business" in str2[:20]:
-        return "1", 0
-    if "risk" in str2[:15] and "parti" not in str2:
-        return "1A", 1
-    if "unresolved" in str2[:20] and "parti" not in str2:
-        return ("1B", 2)
-    if "cybersecurity" in str2[:25] and "parti" not in str2:
-        return ("1C", 3)
-    if "properties" in str2[:25] and "parti" not in str2:
-        return ("2", 4)
-    if "legalproceedings" in str2[:25] and "parti" not in str2:
-        return ("3", 5)
-    if "min" in str2[:25] and "safety" in str2[:25] and "parti" not in str2:
-        return ("4", 6)
-    if "submission" in str2[:25] and "parti" not in str2:
-        return ("4", 6)
-    if "executiveofficers" in str2[:25] and "parti" not in str2:
-        return ("4", 6)
-    if "marketfor" in str2[:25]:
-        return ("5", 7)
-    if "marketprice" in str2[:25]:
-        return ("5", 7)
-    if (
-        "selectedfinancial" in str2.replace("consolidated", "")[:50]
-        and "partii" not in str2
-    ):
-        return ("6", 8)
-    if "reserved" in str2[:30] and "partii" not in str2:
-        return ("6", 8)
-    if ("management" in str2 and "sdiscussion" in str2[:100]) and "partii" not in str2:
-        return ("7", 9)
-    if (
-        "quantitativeandqualitative" in str2[:40]
-        or "qualitativeandquantitative" in str2[:40]
-    ) and "partii" not in str2:
-        return ("7A", 10)
-    if "financialstatement" in str2[:30] and "partii" not in str2:
-        return ("8", 11)
-    if "changesinanddisagreements" in str2[:35] and "partii" not in str2:
-        return ("9", 12)
-    if "controlsandprocedures" in str2[:30] and "partii" not in str2:
-        return ("9A", 13)
-    if "otherinfo" in str2[:20] and "partii" not in str2:
-        return ("9B", 14)
-    if "disclosureregarding" in str2[:40] and "partii" not in str2:
-        return ("9C", 15)
-    if (
-        ("directors" in str2[:50]) or ("trustees" in str2[:50])
-    ) and "executive" in str2[:50]:
-        return ("10", 16)
-    if "executivecompensation" in str2[:35] and "partiii" not in str2:
-        return ("11", 17)
-    if "securityownership" in str2[:30] and "partiii" not in str2:
-        return ("12", 18)
-    if "certainrelationships" in str2[:30] and "partiii" not in str2:
-        return ("13", 19)
-    if "principala" in str2[:25] and "partiii" not in str2:
-        return ("14", 20)
+    skip, groups, _ = compile_item_title_rules(form)
+    if skip and (_match_spec(form, str1, skip) or _match_spec(form, str2, skip)):
+        return None
+    return _match_groups(form, groups, str1, str2)
+
+
+def is_10k_item_title(str1, str2):
+    return classify_item_title("10-K", str1, str2)
 
 
 def is_10q_part1_item_title(str1, str2):
-    str1 = str1.lower().replace(" ", "")
-    str2 = str2.lower().replace(" ", "")
-    if (
-        "financialstatement"
-        in str1.replace("condensed", "").replace("consolidated", "")[:30]
-    ):
-        return ("1.1", 4)  ### Item 1 can sometimes go behind item 2-4
-    if "management" in str1 and "sdiscussion" in str1[:40]:
-        return ("1.2", 4)
-    if (
-        "quantitativeandqualitative" in str1[:35]
-        or "qualitativeandquantitative" in str1[:35]
-    ):
-        return ("1.3", 4)
-    if "controlsandprocedures" in str1[:30] or "controlsprocedures" in str1[:30]:
-        return ("1.4", 4)
-    if (
-        "financialstatement"
-        in str2.replace("condensed", "").replace("consolidated", "")[:30]
-    ):
-        return ("1.1", 4)  ### Item 1 can sometimes go behind item 2-4
-    if "management" in str2 and "sdiscussion" in str2[:40]:
-        return ("1.2", 4)
-    if (
-        "quantitativeandqualitative" in str2[:35]
-        or "qualitativeandquantitative" in str2[:35]
-    ):
-        return ("1.3", 4)
-    if "controlsandprocedures" in str2[:30] or "controlsprocedures" in str2[:30]:
-        return ("1.4", 4)
-    return None
+    groups = compile_item_title_rules("10-Q")[1]
+    return _match_groups("10-Q", groups[:1], str1, str2)
 
 
 def is_10q_part2_item_title(str1, str2):
-    str1 = str1.lower().replace(" ", "")
-    str2 = str2.lower().replace(" ", "")
-    if "legalproceedings" in str1[:25]:
-        return ("2.1", 5)
-    if "riskfactors" in str1.replace("legal", "")[:20]:
-        return ("2.1A", 6)
-    if "useofproceeds" in str1[:70] or "unregisteredsales" in str1[:70]:
-        return ("2.2", 7)
-    if "repurchase" in str1[:40]:
-        return ("2.2", 7)
-    if "defaults" in str1:
-        return ("2.3", 8)
-    if "submission" in str1[:20]:
-        return ("2.4", 9)
-    if "minesafety" in str1[:20]:
-        return ("2.4", 9)
-    if "reserved" in str1[:40]:
-        return ("2.4", 9)
-    if (
-        ("part" not in str1)
-        and ("otherinformation" in str1[:25])
-        or ("otheritems" in str1[:25])
-    ):
-        return ("2.5", 10)
-    if "legalproceedings" in str2[:25]:
-        return ("2.1", 5)
-    if "riskfactors" in str2.replace("legal", "")[:20]:
-        return ("2.1A", 6)
-    if "repurchase" in str2[:40]:
-        return ("2.2", 7)
-    if "useofproceeds" in str2[:70] or "unregisteredsales" in str2[:70]:
-        return ("2.2", 7)
-    if "defaults" in str2:
-        return ("2.3", 8)
-    if "minesafety" in str2[:20]:
-        return ("2.4", 9)
-    if "submission" in str2[:20]:
-        return ("2.4", 9)
-    if "reserved" in str2[:40]:
-        return ("2.4", 9)
-    if (
-        ("part" not in str2)
-        and ("otherinformation" in str2[:25])
-        or ("otheritems" in str2[:25])
-    ):
-        return ("2.5", 10)
-    return None
+    groups = compile_item_title_rules("10-Q")[1]
+    return _match_groups("10-Q", groups[1:], str1, str2)
 
 
 def is_sorted(seq):
@@ -257,91 +273,221 @@ def is_sorted(seq):
     return all((prev := cur) <= (cur := nxt) for nxt in seq_iter)
 
 
-def parse_html(html, debug=False):
-    # Read the raw HTML content from the file
-    if debug:
-        raw = open(html, "rb").read()
-    else:
-        raw = html
+def indent_spaces(name, style):
+    # Indentation written before the text of a <p> or <div> with this style
+    if name == "p":
+        margin_left_value = css_style.parse_style(style).margin_left_pt
+        if margin_left_value is not None and margin_left_value >= 12:
+            return "&nbsp;" * ((margin_left_value - 12) // 12 * 4)
+    elif name == "div":
+        margin_left_value = css_style.parse_style(style).text_indent_pt
+        if margin_left_value is not None:
+            return "&nbsp;" * (math.floor(margin_left_value / 6.75) * 4)
+    return None
 
+
+def iter_chunks(raw, size=chunk_size):
+    for i in range(0, len(raw), size):
+        yield raw[i : i + size]
+
+
+def strip_tags(chunks, invalid=invalid_tags, remove=remove_tags):
+    # Streaming filter over str or bytes chunks. `invalid` entries are
+    # dropped from the start pattern through the end pattern (contents
+    # included), `remove` entries from the start pattern through the next
+    # end pattern (the tag alone). Patterns match case-insensitively, so
+    # <ix:nonNumeric> and <ix:nonnumeric> are both stripped. Only a
+    # pattern-sized tail is held back between chunks.
+    rules = list(invalid) + list(remove)
+    if not rules:
+        yield from chunks
+        return
+
+    start_re = end_res = None
+    hold = max(len(start) for start, _ in rules) - 1
+    buf = None
+    end_re = None  # set while skipping to the end of a matched pattern
+    for chunk in chunks:
+        if start_re is None:
+            enc = (lambda s: s.encode()) if isinstance(chunk, bytes) else str
+            start_re = re.compile(
+                enc("|".join("(" + re.escape(start) + ")" for start, _ in rules)),
+                re.IGNORECASE,
+            )
+            end_res = [
+                re.compile(enc(re.escape(end)), re.IGNORECASE) for _, end in rules
+            ]
+            buf = chunk[:0]
+        buf += chunk
+        pos = 0
+        while True:
+            if end_re is not None:
+                m = end_re.search(buf, pos)
+                if m is None:
+                    # Keep just enough to catch an end pattern split across chunks
+                    buf = buf[max(pos, len(buf) - len(end_re.pattern)) :]
+                    break
+                pos = m.end()
+                end_re = None
+            m = start_re.search(buf, pos)
+            if m is None:
+                keep = max(pos, len(buf) - hold)
+                if keep > pos:
+                    yield buf[pos:keep]
+                buf = buf[keep:]
+                break
+            if m.start() > pos:
+                yield buf[pos : m.start()]
+            end_re = end_res[m.lastindex - 1]
+            pos = m.end()
+    if buf and end_re is None:
+        yield buf
+
+
+def insert_table_placeholders(raw_disp):
+    # Builds raw_parse in one pass: a "[*tableN]" row goes before the first
+    # <tr> following the N-th <table>. Also returns the offset of each
+    # table's <table tag in raw_disp, keyed by table number.
+    pieces = []
+    table_offsets = {}
+    pending_tables = []
+    last = 0
+    for m in table_row_re.finditer(raw_disp):
+        if m.group().lower() == "<table":
+            table_offsets[len(table_offsets) + 1] = m.start()
+            pending_tables.append(len(table_offsets))
+        elif pending_tables:
+            pieces.append(raw_disp[last : m.start()])
+            for num in pending_tables:
+                pieces.append("<tr><td>[*table" + str(num) + "]</td></tr>")
+            pending_tables = []
+            last = m.start()
+    pieces.append(raw_disp[last:])
+    return "".join(pieces), table_offsets
+
+
+def preprocess_html(raw, invalid=invalid_tags, remove=remove_tags):
+    # iXBRL tags are stripped from the raw input before parsing, then a
+    # single traversal of the parsed tree does form detection and indent
+    # injection, and table placeholders are added to the serialized html.
+    # Returns the form type, the html part with table placeholders
+    # (raw_parse), the same html without them (raw_disp) and the offset of
+    # each table in raw_disp.
+    raw = raw[:0].join(strip_tags(iter_chunks(raw), invalid, remove))
     table_soup = BeautifulSoup(raw, "html.parser")
 
-    if table_soup.find_all("10k"):
-        form = "10-K"
-    else:
-        form = "10-Q"
-
-    for p_tag in table_soup.find_all("p"):
-        style = p_tag.get("style", "")
-        margin_left_match = re.search(r"margin-left:(\d+)pt;", style)
-        if margin_left_match:
-            margin_left_value = int(margin_left_match.group(1))
-            if margin_left_value < 12:
-                continue
-            spaces = "&nbsp;" * ((margin_left_value - 12) // 12 * 4)
-            p_tag.insert(0, spaces)
-    for div_tag in table_soup.find_all("div"):
-        style = div_tag.get("style", "")
-        margin_left_match = re.search(r"text-indent:([\d.]+)pt", style)
-        if margin_left_match:
-            margin_left_value = float(margin_left_match.group(1))
-            spaces = "&nbsp;" * (math.floor(margin_left_value / 6.75) * 4)
-            div_tag.insert(0, spaces)
-            # print(margin_left_value)
+    form = "10-Q"
+    for tag in table_soup.descendants:
+        if not isinstance(tag, Tag):
+            continue
+        if tag.name == "10k":
+            form = "10-K"
+        spaces = indent_spaces(tag.name, tag.get("style", ""))
+        if spaces is not None:
+            tag.insert(0, spaces)
 
     raw = str(table_soup)
 
-    # Remove invalid tags
-    for it in invalid_tags:
-        while it[0] in raw:
-            id0 = raw.index(it[0])
-            id1 = raw.index(it[1]) + len(it[1])
-            raw = raw[:id0] + raw[id1:]
-    for it in remove_tags:
-        while it[0] in raw:
-            id0 = raw.index(it[0])
-            id1 = raw[id0:].index(it[1]) + len(it[1])
-            raw = raw[:id0] + raw[id0 + id1 :]
-
     # Parse html part from the file
-    id0 = raw.lower().index("<html")
-    id1 = raw.lower().index("</html>")
-    raw_parse = raw[id0 : id1 + 7]
-    raw_disp = copy(raw_parse)
-
-    # offsets = []
-    # for i in re.finditer("<table", raw_parse.lower()):
-    #     offset = i.span()[0]
-    #     offset = offset + raw_parse[offset:].lower().index("<tr")
-    #     offsets.append(offset)
-    # for i in range(len(offsets)):
-    #     id = offsets[-i - 1]
-    #     raw_parse = (
-    #         raw_parse[:id]
-    #         + "<tr><td>[*table"
-    #         + str(len(offsets) - i)
-    #         + "]</td></tr>"
-    #         + raw_parse[id:]
-    #     )
-
-    offsets = []
-    table_ids = {}  # Track table IDs
-    for i in re.finditer("<table", raw_parse.lower()):
-        offset = i.span()[0]
-        offset = offset + raw_parse[offset:].lower().index("<tr")
-        offsets.append(offset)
-
-    for i in range(len(offsets)):
-        id = offsets[-i - 1]
-        table_num = len(offsets) - i
-        table_ids[id] = str(table_num)  # Store the mapping
-        raw_parse = (
-            raw_parse[:id]
-            + "<tr><td>[*table"
-            + str(table_num)
-            + "]</td></tr>"
-            + raw_parse[id:]
-        )
+    raw_lower = raw.lower()
+    id0 = raw_lower.index("<html")
+    id1 = raw_lower.index("</html>")
+    raw_disp = raw[id0 : id1 + 7]
+    raw_parse, table_offsets = insert_table_placeholders(raw_disp)
+    return form, raw_parse, raw_disp, table_offsets
+
+
+def element_positions(elements):
+    # (category, text) -> ascending positions. Equal elements always share
+    # this key, so candidates only need an == check to match list.index
+    positions = defaultdict(list)
+    for i, element in enumerate(elements):
+        positions[(element.category, element.text)].append(i)
+    return positions
+
+
+def find_element(elements, positions, element, start=0):
+    # Same result as elements.index(element, start)
+    candidates = positions.get((element.category, element.text), [])
+    for i in candidates[bisect_left(candidates, start) :]:
+        if elements[i] == element:
+            return i
+    raise ValueError("element is not in list")
+
+
+def find_text(raw, text_runs, key):
+    # Same result as raw.find(key) for a ">"-prefixed key. text_runs holds
+    # every (text run, offset) following a ">" in raw, sorted, so all runs
+    # starting with the key are adjacent and found with one bisect.
+    body = key[1:]
+    if not body or "<" in body:
+        return raw.find(key)
+    found = -1
+    i = bisect_left(text_runs, (body,))
+    while i < len(text_runs) and text_runs[i][0].startswith(body):
+        if found == -1 or text_runs[i][1] < found:
+            found = text_runs[i][1]
+        i += 1
+    return found
+
+
+def tag_anchors(elements, raw_disp):
+    # Adds id="tagN" to the opening tag of every 6th element found in
+    # raw_disp. Attributes are only inserted inside opening tags, so offsets
+    # into the untagged raw_disp stay valid and all inserts happen at the end.
+    text_runs = sorted((m.group(1), m.start()) for m in text_run_re.finditer(raw_disp))
+    id_counts = Counter(element.id for element in elements)
+    tag_starts = {}
+    anchorid = {}
+    anchor_texts = set()
+    inserts = []
+    for i in range(0, len(elements), 6):
+        element = elements[i]
+        if element.category == "Table":
+            continue
+        key = ">" + " ".join(element.text.split(" ")[:10])
+        # todo: ignoring some tags now
+        if element.text in anchor_texts or id_counts[element.id] != 1:
+            continue
+        id = find_text(raw_disp, text_runs, key)
+        if id == -1:
+            continue
+        if element.tag not in tag_starts:
+            tag_starts[element.tag] = [
+                m.start() for m in re.finditer(re.escape("<" + element.tag), raw_disp)
+            ]
+        starts = tag_starts[element.tag]
+        j = bisect_left(starts, id)
+        if j:
+            anchor_texts.add(element.text)
+            anchorid[element.id] = len(inserts)
+            inserts.append(starts[j - 1] + len(element.tag) + 1)
+
+    # Later anchors on the same tag end up first, as with in-place inserts
+    order = sorted(range(len(inserts)), key=lambda t: (inserts[t], -t))
+    pieces = []
+    last = 0
+    for tagid in order:
+        pieces.append(raw_disp[last : inserts[tagid]])
+        pieces.append(' id="tag' + str(tagid) + '"')
+        last = inserts[tagid]
+    pieces.append(raw_disp[last:])
+    return "".join(pieces), anchorid
+
+
+def parse_html(html, debug=False):
+    return "".join(iter_parse_html(html, debug))
+
+
+def iter_parse_html(html, debug=False):
+    # Yields the "tid,<table>...</table>\n" lines of parse_html one table at a time
+    # Read the raw HTML content from the file
+    if debug:
+        raw = open(html, "rb").read()
+    else:
+        raw = html
+
+    form, raw_parse, raw_disp, table_offsets = preprocess_html(raw)
 
     html_document = HTMLDocument.from_string(raw_parse).doc_after_cleaners(
         skip_headers_and_footers=True, inplace=True
@@ -383,6 +529,9 @@ def parse_html(html, debug=False):
                 + element.text_as_html[element.text_as_html.rindex("]") + 11 :]
             )
 
+    elements = html_document.elements
+    positions = element_positions(elements)
+
     # look at text only after table of content
     idtoc = 0
     if len(html_document.pages) > 5:
@@ -413,57 +562,27 @@ def parse_html(html, debug=False):
                 )
             )
             if f:
-                idtoc = html_document.elements.index(f[-1]) + 1
+                idtoc = find_element(elements, positions, f[-1]) + 1
                 break
 
     # Tagging html
-    tagid = 0
-    anchorid = {}
-    anchor_texts = []
-    ids = list(map(lambda p: p.id, html_document.elements))
-    unique_ids = list(filter(lambda p: ids.count(p) == 1, ids))
-    for i in range(0, len(html_document.elements), 6):
-        if html_document.elements[i].category != "Table":
-            key = ">" + " ".join(html_document.elements[i].text.split(" ")[:10])
-            # todo: ignoring some tags now
-            if (
-                (html_document.elements[i].text not in anchor_texts)
-                and (key in raw_disp)
-                and (html_document.elements[i].id in unique_ids)
-            ):
-                id = raw_disp.index(key)
-                if "<" + html_document.elements[i].tag in raw_disp[:id]:
-                    id = (
-                        raw_disp[:id].rindex("<" + html_document.elements[i].tag)
-                        + len(html_document.elements[i].tag)
-                        + 1
-                    )
-                    anchor_texts.append(html_document.elements[i].text)
-                    anchorid[html_document.elements[i].id] = tagid
-                    raw_disp = (
-                        raw_disp[:id] + ' id="tag' + str(tagid) + '"' + raw_disp[id:]
-                    )
-                    tagid += 1
+    raw_disp, anchorid = tag_anchors(elements, raw_disp)
 
     index = {}
     index["0"] = {"id": 0, "guid": "", "order": 0}
-    for element in html_document.elements[idtoc:-2]:
-        offset = idtoc if len(index) == 1 else index[list(index)[-1]]["id"] + 1
-        id = html_document.elements[offset:].index(element) + offset
+    for element in elements[idtoc:-2]:
+        last = index[next(reversed(index))]
+        offset = idtoc if len(index) == 1 else last["id"] + 1
+        id = find_element(elements, positions, element, offset)
         rtext = element.text.lower()
         text = element.text.lower()
-        nexttext = html_document.elements[id + 1].text.lower()
-        nextelm = html_document.elements[id + 1]
-        ptext = html_document.elements[id - 1].text.lower().split(" ")[-1]
+        nexttext = elements[id + 1].text.lower()
+        nextelm = elements[id + 1]
+        ptext = elements[id - 1].text.lower().split(" ")[-1]
         match = match_item_title(ptext, rtext, text)
         if match and (idtoc == 0 or ((not element.links) and (not nextelm.links))):
-            if form == "10-Q":
-                p1 = is_10q_part1_item_title(text, nexttext)
-                p2 = is_10q_part2_item_title(text, nexttext)
-                p = p1 or p2
-            else:
-                p = is_10k_item_title(element.text, nexttext)
-            if p and (p[1] >= index[list(index)[-1]]["order"]):
+            p = classify_item_title(form, text, nexttext)
+            if p and (p[1] >= last["order"]):
                 index[p[0]] = {"id": id, "guid": element.id, "order": p[1]}
         # print(element.text)
 
@@ -476,7 +595,7 @@ def parse_html(html, debug=False):
             )
         )
         if lst:
-            id = html_document.elements.index(lst[0])
+            id = find_element(elements, positions, lst[0])
             index["1.1"] = {"id": id, "guid": "", "order": 1}
             index = dict(sorted(index.items(), key=lambda item: item))
 
@@ -484,7 +603,6 @@ def parse_html(html, debug=False):
     guids = [index[i]["guid"] for i in index]
     titles = [i for i in index]
 
-    output = ""
     for i in range(len(ids)):
         for element in html_document.elements[
             ids[i] : ids[i + 1] if i < len(ids) - 1 else -1
@@ -496,13 +614,13 @@ def parse_html(html, debug=False):
                     .replace("<table></table>", "")
                 ):
                     continue
+                if html2md.is_layout_table(element.text_as_html):
+                    continue
                 markdown = html2md.process(
                     io.StringIO(element.text_as_html), element.tid
                 )
                 if markdown:
-                    output += element.tid + "," + element.text_as_html + "\n"
-
-    return output
+                    yield element.tid + "," + element.text_as_html + "\n"
 
 
 if __name__ == "__main__":
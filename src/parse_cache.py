@@ -0,0 +1,97 @@
+import json
+import os
+import threading
+
+import xxhash
+
+from src.html_parsing import PARSER_VERSION
+
+
+class ParseCache:
+    """
+    On-disk cache of parse results keyed by the hash of the uploaded bytes
+    and the parser version. Entries are evicted least recently used first
+    once the cache grows past max_bytes.
+    """
+
+    def __init__(self, cache_dir, max_bytes=512 << 20):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._size = sum(size for _, size, _ in self._entries())
+
+    @staticmethod
+    def key(raw):
+        h = xxhash.xxh3_128(raw)
+        h.update(PARSER_VERSION.encode())
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def _entries(self):
+        # (path, size, last use) of every stored result
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".json"):
+                    stat = entry.stat()
+                    yield entry.path, stat.st_size, stat.st_mtime
+
+    def get(self, raw):
+        """
+        Returns:
+            tuple: (csv_tables, table_map), or None on a miss
+        """
+        path = self._path(self.key(raw))
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                result = json.load(f)
+            # The mtime records the last use for LRU eviction
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return result["csv_tables"], result["table_map"]
+
+    def put(self, raw, csv_tables, table_map):
+        path = self._path(self.key(raw))
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"csv_tables": csv_tables, "table_map": table_map}, f)
+        size = os.path.getsize(tmp_path)
+        with self._lock:
+            if os.path.exists(path):
+                self._size -= os.path.getsize(path)
+            os.replace(tmp_path, path)
+            self._size += size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        for path, size, _ in sorted(self._entries(), key=lambda e: e[2]):
+            if self._size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._size -= size
+            self.evictions += 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,156 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from src import encoding, html_parsing, html2csv
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    pass
+
+
+def run_parse(raw):
+    html_content = encoding.decode_html(raw)
+    processed_html = html_parsing.parse_html(html_content)
+    return html2csv.process(processed_html)
+
+
+class JobQueue:
+    """
+    Runs filing parses on a bounded pool of worker processes.
+
+    At most max_pending jobs may be queued or running; submit raises
+    QueueFull past that so the caller can push back. Finished jobs are
+    kept for keep_seconds to be collected.
+    """
+
+    def __init__(self, workers=2, max_pending=8, keep_seconds=600, on_done=None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.keep_seconds = keep_seconds
+        self.on_done = on_done
+        self._pool = None
+        self._jobs = {}
+        self._futures = {}
+        self._cond = threading.Condition()
+
+    def _pending(self):
+        return sum(
+            job["status"] in ("queued", "running") for job in self._jobs.values()
+        )
+
+    def _prune(self):
+        cutoff = time.time() - self.keep_seconds
+        for job_id in [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job["finished"] and job["finished"] < cutoff
+        ]:
+            del self._jobs[job_id]
+
+    def submit(self, raw, result=None):
+        """
+        Queue a filing for parsing.
+
+        Args:
+            raw (bytes): Uploaded filing
+            result (tuple, optional): Known (csv_tables, table_map), e.g. from
+                                      the parse cache; the job is done at once
+
+        Returns:
+            str: Job id
+        """
+        job_id = uuid.uuid4().hex
+        job = {
+            "status": "queued",
+            "submitted": time.time(),
+            "finished": None,
+            "result": None,
+            "error": None,
+        }
+        with self._cond:
+            self._prune()
+            if result is not None:
+                job.update(status="done", finished=time.time(), result=result)
+                self._jobs[job_id] = job
+                return job_id
+            if self._pending() >= self.max_pending:
+                raise QueueFull(f"{self.max_pending} jobs already pending")
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            self._jobs[job_id] = job
+            pool = self._pool
+            future = pool.submit(run_parse, raw)
+            self._futures[job_id] = future
+        future.add_done_callback(lambda f: self._finish(job_id, raw, f, pool))
+        return job_id
+
+    def _finish(self, job_id, raw, future, pool=None):
+        # pool: the pool the job ran on
+        try:
+            result = future.result()
+            error = None
+        except Exception as e:
+            result, error = None, str(e) or type(e).__name__
+            if isinstance(e, BrokenProcessPool) and pool is not None:
+                # A worker died; start a fresh pool for the next submission,
+                # unless one was already started after an earlier failure
+                with self._cond:
+                    if self._pool is pool:
+                        self._pool = None
+                pool.shutdown(wait=False, cancel_futures=True)
+        try:
+            if result is not None and self.on_done:
+                self.on_done(raw, *result)
+        except Exception:
+            # The parse still succeeded; only e.g. caching it failed
+            logger.exception("on_done of job %s failed", job_id)
+        finally:
+            # Always settle the job, or it would count as pending for good
+            with self._cond:
+                self._futures.pop(job_id, None)
+                job = self._jobs.get(job_id)
+                if job is not None:
+                    job.update(
+                        status="failed" if error else "done",
+                        finished=time.time(),
+                        result=result,
+                        error=error,
+                    )
+                self._cond.notify_all()
+
+    def status(self, job_id, wait=0):
+        """
+        Current state of a job, waiting up to `wait` seconds for it to finish.
+
+        Returns:
+            dict: Job record, or None for an unknown job id
+        """
+        deadline = time.time() + wait
+        with self._cond:
+            while True:
+                job = self._jobs.get(job_id)
+                if job is None or job["finished"]:
+                    return job and dict(job)
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    job = dict(job)
+                    future = self._futures.get(job_id)
+                    if future is not None and future.running():
+                        job["status"] = "running"
+                    return job
+                self._cond.wait(remaining)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "pending": self._pending(),
+                "max_pending": self.max_pending,
+                "workers": self.workers,
+                "jobs": len(self._jobs),
+            }
@@ -0,0 +1,279 @@
+import re
+import warnings
+
+warnings.simplefilter(action="ignore", category=FutureWarning)
+import numpy as np
+import pandas as pd
+from lxml.etree import XMLSyntaxError
+from lxml.html import HTMLParser, fromstring, parse
+from pandas._libs.parsers import STR_NA_VALUES
+from pandas.errors import EmptyDataError
+from pandas.io.parsers import TextParser
+
+# Tables are read as pd.read_html(flavor="lxml", displayed_only=False)
+# reads them: the row and span handling below follows pandas.io.html.
+# Columns of a table without a header are typed here, converting numbers
+# with pd.to_numeric as TextParser does, without building a DataFrame;
+# tables with a header are left to TextParser, which also makes the labels.
+
+whitespace_re = re.compile(r"[\r\n]+|\s{2,}")
+table_xpath = "//table[.//text()[re:test(., '.+')]]"
+re_namespace = {"re": "http://exslt.org/regular-expressions"}
+# Numbers TextParser(thousands=",") drops the commas of
+thousands_re = re.compile(
+    r"^[\-\+]?([0-9]+,|[0-9])*(\.[0-9]*)?([0-9]?(E|e)\-?[0-9]+)?$"
+)
+bool_values = {"True": True, "TRUE": True, "true": True}
+bool_values.update({"False": False, "FALSE": False, "false": False})
+
+
+def parse_document(html):
+    """
+    Parse HTML the way pd.read_html does.
+
+    Args:
+        html: Markup as a string, or a file-like object
+
+    Returns:
+        lxml.html.HtmlElement: Root element, with line breaks kept as "\\n"
+    """
+    parser = HTMLParser(recover=True)
+    if isinstance(html, str):
+        # pandas fails to open a markup string as a file and falls back to
+        # fromstring, which returns the lone top-level element of a fragment
+        root = fromstring(html, parser=parser)
+    else:
+        root = parse(html, parser=parser).getroot()
+        if root is None:
+            raise XMLSyntaxError("no text parsed from document", 0, 0, 0)
+    for br in root.xpath("*//br"):
+        br.tail = "\n" + (br.tail or "")
+    return root
+
+
+def find_tables(root):
+    """
+    Returns:
+        list: <table> elements holding any text, outer tables first
+
+    Raises:
+        ValueError: No such table
+    """
+    tables = root.xpath(table_xpath, namespaces=re_namespace)
+    if not tables:
+        raise ValueError("No tables found matching regex '.+'")
+    return tables
+
+
+def cells(tr):
+    return [td for td in tr if td.tag == "td" or td.tag == "th"]
+
+
+def body_rows(table):
+    return table.xpath(".//tbody//tr") + table.xpath("./tr")
+
+
+def footer_rows(table):
+    return table.xpath(".//tfoot//tr")
+
+
+def section_rows(table):
+    """
+    Returns:
+        tuple: (header, body, footer) <tr> elements; without a <thead>, the
+               leading rows made only of <th> cells are the header
+    """
+    header = []
+    for thead in table.xpath(".//thead"):
+        header.extend(thead.xpath("./tr"))
+        if cells(thead):
+            # A <thead> holding cells without a <tr> is read as a row
+            header.append(thead)
+    body = body_rows(table)
+    if not header:
+        while body and all(td.tag == "th" for td in cells(body[0])):
+            header.append(body.pop(0))
+    return header, body, footer_rows(table)
+
+
+def expand_rows(rows):
+    """
+    Cell texts of <tr> elements, with every colspan and rowspan repeated over
+    the cells it covers.
+
+    Args:
+        rows (list): <tr> elements
+
+    Returns:
+        list: One list of str per row; rows can be of different lengths
+
+    Raises:
+        ValueError: A colspan or rowspan is not an integer
+    """
+    grid = []
+    # (column, text, rows left) of the cells spanning down from earlier rows
+    remainder = []
+    for tr in rows:
+        texts = []
+        next_remainder = []
+        index = 0
+        for td in cells(tr):
+            while remainder and remainder[0][0] <= index:
+                prev_i, prev_text, prev_rowspan = remainder.pop(0)
+                texts.append(prev_text)
+                if prev_rowspan > 1:
+                    next_remainder.append((prev_i, prev_text, prev_rowspan - 1))
+                index += 1
+            text = whitespace_re.sub(" ", td.text_content().strip())
+            rowspan = int(td.get("rowspan") or 1)
+            colspan = int(td.get("colspan") or 1)
+            for _ in range(colspan):
+                texts.append(text)
+                if rowspan > 1:
+                    next_remainder.append((index, text, rowspan - 1))
+                index += 1
+        for prev_i, prev_text, prev_rowspan in remainder:
+            texts.append(prev_text)
+            if prev_rowspan > 1:
+                next_remainder.append((prev_i, prev_text, prev_rowspan - 1))
+        grid.append(texts)
+        remainder = next_remainder
+    while remainder:
+        # Rows that only exist because of a rowspan
+        texts = []
+        next_remainder = []
+        for prev_i, prev_text, prev_rowspan in remainder:
+            texts.append(prev_text)
+            if prev_rowspan > 1:
+                next_remainder.append((prev_i, prev_text, prev_rowspan - 1))
+        grid.append(texts)
+        remainder = next_remainder
+    return grid
+
+
+def frame_cells(df):
+    # (columns, rows) of a DataFrame, read per column so cells keep their
+    # column's type, with None for NaN
+    columns = list(df.columns)
+    data = [df.iloc[:, c].tolist() for c in range(df.shape[1])]
+    data = [[None if v != v else v for v in values] for values in data]
+    return columns, [list(row) for row in zip(*data)]
+
+
+def type_column(texts):
+    """
+    Values of a column as TextParser(thousands=",") types them: numbers if
+    every cell is one, else booleans if every cell is one, else the texts.
+
+    Returns:
+        list: Values, None for NaN
+    """
+    texts = [
+        (
+            text.replace(",", "")
+            if "," in text and thousands_re.search(text.strip())
+            else text
+        )
+        for text in texts
+    ]
+    na = [text in STR_NA_VALUES for text in texts]
+    try:
+        values = pd.to_numeric(
+            np.array(
+                [np.nan if is_na else text for text, is_na in zip(texts, na)],
+                dtype=object,
+            )
+        )
+    except (ValueError, TypeError):
+        pass
+    else:
+        if values.dtype == object:
+            # Integers past int64 beside negative ones or NaN, which
+            # TextParser leaves as the texts they were
+            return texts
+        return [None if value != value else value for value in values.tolist()]
+    if all(is_na or text in bool_values for text, is_na in zip(texts, na)):
+        return [None if is_na else bool_values[text] for text, is_na in zip(texts, na)]
+    return [None if is_na else text for text, is_na in zip(texts, na)]
+
+
+def read_table(table):
+    # (columns, rows) of a table, or None for a table without rows
+    header_trs, body_trs, footer_trs = section_rows(table)
+    head = expand_rows(header_trs)
+    body = expand_rows(body_trs)
+    header = None
+    if head:
+        body = head + body
+        # Header inference of pd.read_html
+        if len(head) == 1:
+            header = 0
+        else:
+            header = [i for i, row in enumerate(head) if any(text for text in row)]
+    body += expand_rows(footer_trs)
+    if not body:
+        return None
+    n_cols = max(len(texts) for texts in body)
+    for texts in body:
+        texts += [""] * (n_cols - len(texts))
+    # TextParser strips a byte order mark, and quotes after it, from the
+    # first cell
+    if header is None and not body[0][0].startswith("\ufeff"):
+        if n_cols == 1:
+            # Blank lines are skipped
+            body = [texts for texts in body if texts[0]]
+            if not body:
+                return None
+        data = [type_column(texts) for texts in zip(*body)]
+        return list(range(n_cols)), [list(row) for row in zip(*data)]
+    try:
+        with TextParser(body, header=header, skiprows=0, thousands=",") as parser:
+            return frame_cells(parser.read())
+    except EmptyDataError:
+        return None
+
+
+def read_tables(html):
+    """
+    Read every table of an HTML document into a grid of cells.
+
+    Cells hold the values pd.read_html(html, flavor="lxml",
+    displayed_only=False) would put in its DataFrames, with None for NaN.
+
+    Args:
+        html: Markup as a string, or a file-like object
+
+    Returns:
+        list: (columns, rows) per table, where columns are the column labels
+              and rows are lists of cells
+
+    Raises:
+        ValueError: No table in the document, or a malformed span
+    """
+    tables = []
+    for table in find_tables(parse_document(html)):
+        grid = read_table(table)
+        if grid is not None:
+            tables.append(grid)
+    return tables
+
+
+def drop_empty(columns, rows, index=None, empty=None):
+    """
+    Drop the columns, then the rows, that hold nothing but `empty`, like
+    DataFrame.dropna(how="all").
+
+    Returns:
+        tuple: (columns, rows, index), index being the labels of the rows kept
+    """
+    if index is None:
+        index = list(range(len(rows)))
+    keep = [c for c in range(len(columns)) if any(row[c] != empty for row in rows)]
+    if len(keep) < len(columns):
+        columns = [columns[c] for c in keep]
+        rows = [[row[c] for c in keep] for row in rows]
+    kept = [r for r, row in enumerate(rows) if any(cell != empty for cell in row)]
+    if len(kept) < len(rows):
+        rows = [rows[r] for r in kept]
+        index = [index[r] for r in kept]
+    return columns, rows, index
@@ -0,0 +1,252 @@
+import codecs
+import io
+import re
+from collections import deque
+from typing import NamedTuple, Optional, Tuple
+
+from lxml import etree
+from lxml.html import HTMLParser, fragment_fromstring, fromstring
+
+from unstructured.utils import htmlify_matrix_of_cell_texts
+
+from src import css_style, encoding, html2md, html_parsing
+
+# The filing is decoded and scanned a chunk at a time for <table> tags, as
+# insert_table_placeholders finds them. Only the table being read, or the
+# text just before the next one, is held, so memory follows the largest
+# table rather than the filing. Each table, and the text before it, is
+# parsed with lxml on its own.
+
+BLOCK_TAGS = ["p", "div", "h1", "h2", "h3", "h4", "h5", "h6", "li", "center"]
+HEADING_TAGS = frozenset(["h1", "h2", "h3", "h4", "h5", "h6"])
+BOLD_TAGS = frozenset(["b", "strong"])
+BOLD_WEIGHTS = frozenset(["bold", "bolder", "700", "800", "900"])
+CONTEXT_BLOCKS = 3
+CONTEXT_CHARS = 16 * 1024
+MAX_BLOCK_CHARS = 300
+table_tag_re = re.compile(r"<(/?)table", re.IGNORECASE)
+whitespace_re = re.compile(r"\s+")
+# Longest table tag prefix a chunk can end in
+HOLD = len("</table") - 1
+
+
+class StreamedTable(NamedTuple):
+    """
+    A top-level table of a filing.
+
+    tid numbers tables as parse_html does, counting every <table> tag
+    including nested ones from 1. heading is the nearest heading-like block
+    before the table (an <h1>-<h6>, or a block whose text is all bold) and
+    context the text blocks right before it, nearest last.
+    """
+
+    tid: int
+    html: str
+    heading: Optional[str]
+    context: Tuple[str, ...]
+
+
+def _tag(elem):
+    # Comments and processing instructions have a function as tag
+    return elem.tag.lower() if isinstance(elem.tag, str) else None
+
+
+def _text(elem):
+    text = whitespace_re.sub(" ", elem.text_content()).strip()
+    return text[:MAX_BLOCK_CHARS]
+
+
+def _is_bold(elem):
+    style = elem.get("style")
+    return _tag(elem) in BOLD_TAGS or (
+        style is not None
+        and css_style.parse_style(style.lower()).weight in BOLD_WEIGHTS
+    )
+
+
+def _bold_text(elem):
+    if _is_bold(elem):
+        return elem.text_content()
+    return "".join(_bold_text(child) for child in elem if _tag(child))
+
+
+def _is_heading(elem, text):
+    if _tag(elem) in HEADING_TAGS:
+        return True
+    return whitespace_re.sub("", _bold_text(elem)) == whitespace_re.sub("", text)
+
+
+def read_blocks(markup):
+    """
+    Text blocks of the markup between two tables.
+
+    Args:
+        markup (str): Markup, possibly starting or ending inside a tag
+
+    Returns:
+        list: (text, whether the block looks like a heading) per block
+    """
+    lt, gt = markup.find("<"), markup.find(">")
+    if gt != -1 and (lt == -1 or gt < lt):
+        # Cut in the middle of a tag
+        markup = markup[gt + 1 :]
+    if not markup.strip():
+        return []
+    root = fragment_fromstring(markup, create_parent="div")
+    etree.strip_elements(root, "script", "style", "title", with_tail=False)
+    blocks = []
+    for elem in root.iter(*BLOCK_TAGS):
+        if next(elem.iterdescendants(*BLOCK_TAGS), None) is not None:
+            # Read through the blocks it holds
+            continue
+        text = _text(elem)
+        if text:
+            blocks.append((text, _is_heading(elem, text)))
+    if not blocks:
+        text = _text(root)
+        if text:
+            blocks.append((text, _is_heading(root, text)))
+    return blocks
+
+
+def read_table(markup):
+    """
+    Cell texts of a table, with paragraph indents written into its cells as
+    preprocess_html does, serialized the way parse_html writes its tables.
+
+    Args:
+        markup (str): Markup of one table
+
+    Returns:
+        str: One <td> per cell, or None for a table without text
+    """
+    table = fromstring(markup, parser=HTMLParser(recover=True, huge_tree=True))
+    for elem in table.iter("p", "div"):
+        spaces = html_parsing.indent_spaces(elem.tag, elem.get("style", ""))
+        if spaces is not None:
+            elem.text = spaces + (elem.text or "")
+    # Cells are read as unstructured reads them for Table elements
+    rows = [
+        [
+            " ".join(t for t in (text.strip() for text in td.itertext()) if t)
+            for td in tr.xpath("./td | ./th")
+        ]
+        for tr in table.xpath("./tr | ./thead/tr | ./tbody/tr | ./tfoot/tr")
+    ]
+    if not any(any(row) for row in rows):
+        return None
+    return htmlify_matrix_of_cell_texts(rows)
+
+
+def _chunks(path, chunk_size):
+    with open(path, "rb") as f:
+        chunk = f.read(chunk_size)
+        decoder = codecs.getincrementaldecoder(encoding.stream_encoding(chunk))(
+            errors="replace"
+        )
+        while chunk:
+            yield decoder.decode(chunk)
+            chunk = f.read(chunk_size)
+        yield decoder.decode(b"", final=True)
+
+
+def iter_tables(path, chunk_size=html_parsing.chunk_size):
+    """
+    Read the top-level tables of a filing without loading it whole.
+
+    iXBRL tags are stripped and paragraph indents written into table cells
+    as preprocess_html does.
+
+    Args:
+        path (str): Path to the .htm filing
+        chunk_size (int): Bytes read at a time
+
+    Yields:
+        StreamedTable: Every top-level table holding any text
+    """
+    context = deque(maxlen=CONTEXT_BLOCKS)
+    heading = None
+    n_tables = 0
+    tid = None
+    depth = 0
+    # Text held back: the open table, or else the text after the last table
+    buf = ""
+    pos = 0
+    table_start = None
+    text_start = 0
+    for chunk in html_parsing.strip_tags(_chunks(path, chunk_size)):
+        buf += chunk
+        waiting = False
+        for m in table_tag_re.finditer(buf, pos):
+            if not m.group(1):
+                n_tables += 1
+                if depth == 0:
+                    before = buf[max(text_start, m.start() - CONTEXT_CHARS) : m.start()]
+                    for text, is_heading in read_blocks(before):
+                        context.append(text)
+                        if is_heading:
+                            heading = text
+                    tid = n_tables
+                    table_start = m.start()
+                depth += 1
+                pos = m.end()
+                continue
+            end = buf.find(">", m.end())
+            if end == -1:
+                # The end tag continues in the next chunk
+                pos, waiting = m.start(), True
+                break
+            pos = end + 1
+            if depth == 0:
+                # Stray end tag
+                continue
+            depth -= 1
+            if depth == 0:
+                markup = read_table(buf[table_start:pos])
+                if markup is not None:
+                    yield StreamedTable(tid, markup, heading, tuple(context))
+                table_start, text_start = None, pos
+        if not waiting:
+            pos = max(pos, len(buf) - HOLD)
+        # Drop what has been read, keeping the open table or the end of the
+        # text the next table's context is read from
+        if depth > 0:
+            start = table_start
+            table_start = 0
+        else:
+            start = min(max(len(buf) - HOLD - CONTEXT_CHARS, text_start), pos)
+            text_start = max(text_start - start, 0)
+        buf = buf[start:]
+        pos -= start
+    if depth > 0:
+        # Table left open at the end of the filing
+        markup = read_table(buf[table_start:])
+        if markup is not None:
+            yield StreamedTable(tid, markup, heading, tuple(context))
+
+
+def iter_records(path, chunk_size=html_parsing.chunk_size):
+    """
+    Stream a filing as "tid,<table>...</table>\\n" records, the format of
+    parse_html output that html2csv reads, skipping the layout and empty
+    tables parse_html skips.
+
+    Unlike parse_html, tables before the table of contents or outside the
+    item sections are kept, as finding those needs the whole document.
+
+    Args:
+        path (str): Path to the .htm filing
+        chunk_size (int): Bytes read at a time
+
+    Yields:
+        str: One record per table
+    """
+    for table in iter_tables(path, chunk_size):
+        if html2md.is_layout_table(table.html):
+            continue
+        try:
+            markdown = html2md.process(io.StringIO(table.html), table.tid)
+        except ValueError:
+            continue
+        if markdown:
+            yield f"{table.tid},{table.html}\n"
@@ -0,0 +1,125 @@
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+workspace_id_re = re.compile(r"[0-9a-f]{32}")
+
+
+class Workspaces:
+    """
+    A folder per tagging session under root, so sessions never touch each
+    other's tables.
+
+    Work on a workspace is done holding lock(workspace_id). Workspaces left
+    unused for ttl seconds are removed, checked at most every prune_every
+    seconds as workspaces are opened; on_remove(workspace_id) is called
+    first, holding that workspace's lock.
+    """
+
+    def __init__(self, root, ttl=7 * 24 * 3600, prune_every=600, on_remove=None):
+        self.root = root
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self.on_remove = on_remove
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._pruned = 0
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def new_id():
+        return uuid.uuid4().hex
+
+    @staticmethod
+    def is_valid_id(workspace_id):
+        return bool(workspace_id and workspace_id_re.fullmatch(workspace_id))
+
+    def path(self, workspace_id, *parts):
+        if not self.is_valid_id(workspace_id):
+            raise ValueError(f"Invalid workspace id: {workspace_id!r}")
+        return os.path.join(self.root, workspace_id, *parts)
+
+    def lock(self, workspace_id):
+        with self._lock:
+            return self._locks.setdefault(workspace_id, threading.RLock())
+
+    def open(self, workspace_id):
+        """
+        Create the workspace if needed and mark it used.
+
+        Returns:
+            str: Path of the workspace
+        """
+        path = self.path(workspace_id)
+        with self.lock(workspace_id):
+            os.makedirs(path, exist_ok=True)
+            # The folder's mtime records the last use
+            os.utime(path)
+        if time.time() - self._pruned > self.prune_every:
+            self.prune()
+        return path
+
+    def prune(self):
+        """
+        Remove the workspaces unused for ttl seconds.
+
+        Returns:
+            int: Number of workspaces removed
+        """
+        self._pruned = time.time()
+        cutoff = self._pruned - self.ttl
+        removed = 0
+        with os.scandir(self.root) as it:
+            entries = [entry for entry in it if self.is_valid_id(entry.name)]
+        for entry in entries:
+            lock = self.lock(entry.name)
+            # A workspace in use is left for the next round
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                if os.stat(entry.path).st_mtime >= cutoff:
+                    continue
+                if self.on_remove:
+                    self.on_remove(entry.name)
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+            finally:
+                lock.release()
+            with self._lock:
+                if not os.path.exists(entry.path):
+                    self._locks.pop(entry.name, None)
+        return removed
+
+
+def write_text(path, text):
+    # Write a file beside the old one and swap it in
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def replace_folder(path, files):
+    """
+    Replace a folder with one holding the given files. The new folder is
+    written beside it and swapped in, so it never holds a mix of old and
+    new files.
+
+    Args:
+        path (str): Folder to replace
+        files (dict): File name -> text
+    """
+    suffix = f"{os.getpid()}.{threading.get_ident()}"
+    tmp_path = f"{path}.{suffix}.tmp"
+    old_path = f"{path}.{suffix}.old"
+    os.makedirs(tmp_path)
+    for name, text in files.items():
+        with open(os.path.join(tmp_path, name), "w", newline="", encoding="utf-8") as f:
+            f.write(text)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
@@ -0,0 +1,73 @@
+import hashlib
+import json
+import time
+import zipfile
+
+# zipfile writes to a stream it cannot seek by putting each entry's sizes
+# and CRC in a descriptor after its data, so an archive can be sent as it
+# is produced and only one chunk of a file is held at a time.
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _Chunks:
+    # Write-only file collecting what zipfile writes until it is taken
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def file_chunks(f):
+    # Read a file opened in binary mode in chunks, closing it at the end
+    with f:
+        yield from iter(lambda: f.read(CHUNK_SIZE), b"")
+
+
+def iter_zip(entries, compression=zipfile.ZIP_DEFLATED, manifest=None):
+    """
+    Build a ZIP archive as it is sent.
+
+    Args:
+        entries (iterable): (name, chunks) pairs, chunks being an iterable
+                            of the entry's bytes; both are consumed lazily
+        compression (int): zipfile.ZIP_DEFLATED or zipfile.ZIP_STORED
+        manifest (dict, optional): Written last as manifest.json, with a
+                                   "files" list of each entry's name, size
+                                   and sha256 added
+
+    Yields:
+        bytes: The archive, a piece at a time
+    """
+    out = _Chunks()
+    files = []
+    with zipfile.ZipFile(out, "w", compression) as zf:
+        for name, chunks in entries:
+            info = zipfile.ZipInfo(name, time.localtime()[:6])
+            info.compress_type = compression
+            digest, size = hashlib.sha256(), 0
+            with zf.open(info, "w") as dst:
+                for chunk in chunks:
+                    dst.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+                    data = out.take()
+                    if data:
+                        yield data
+            files.append({"name": name, "bytes": size, "sha256": digest.hexdigest()})
+            yield out.take()
+        if manifest is not None:
+            zf.writestr(
+                "manifest.json", json.dumps(dict(manifest, files=files), indent=2)
+            )
+    yield out.take()
@@ -0,0 +1,37 @@
+import argparse
+import time
+import warnings
+
+warnings.simplefilter(action="ignore", category=FutureWarning)
+from src import html_parsing, html2csv
+
+parser = argparse.ArgumentParser(description="Time the filing parsing pipeline")
+parser.add_argument(
+    "--file",
+    "-f",
+    default="data/htm_input/form10q.htm",
+    help="Path to the .htm filing",
+)
+parser.add_argument(
+    "--repeat", "-r", type=int, default=3, help="Number of timed runs per stage"
+)
+
+args = parser.parse_args()
+with open(args.file, "rb") as f:
+    raw = f.read()
+
+
+def timeit(name, fn, *fn_args):
+    times = []
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        result = fn(*fn_args)
+        times.append(time.perf_counter() - t0)
+    print(f"{name:<24} best {min(times):.3f}s  mean {sum(times) / len(times):.3f}s")
+    return result
+
+
+print(f"{args.file}: {len(raw) / 1e6:.2f} MB, {args.repeat} runs")
+timeit("preprocess_html", html_parsing.preprocess_html, raw)
+processed_html = timeit("parse_html", html_parsing.parse_html, raw)
+timeit("html2csv.process", html2csv.process, processed_html)
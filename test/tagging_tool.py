@@ -1,16 +1,96 @@
-from flask import Flask, request, send_file, render_template, jsonify
+from flask import (
+    Flask,
+    Response,
+    g,
+    request,
+    render_template,
+    jsonify,
+    stream_with_context,
+)
 import os
-import shutil
 import sys
+import threading
+import time
 from werkzeug.utils import secure_filename
 import tempfile, json
-from src import html_parsing, html2csv
-from io import BytesIO
+from src import css_style, csv_update, encoding, html_parsing, html2csv, zip_stream
+from src.edit_journal import EditJournal
+from src.workspace import Workspaces, replace_folder, write_text
+from src.parse_cache import ParseCache
+from src.parse_jobs import JobQueue, QueueFull
 import zipfile
 
 app = Flask(__name__)
 UPLOAD_FOLDER = os.path.join(sys.path[0], "data")
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
+# Idle workspaces, with their tables and journals, are removed after this
+app.config["WORKSPACE_TTL"] = 7 * 24 * 3600
+parse_cache = ParseCache(os.path.join(UPLOAD_FOLDER, "parse_cache"), max_bytes=1 << 30)
+parse_jobs = JobQueue(workers=2, max_pending=8, on_done=parse_cache.put)
+# (workspace id, filing) -> EditJournal of its tables
+journals = {}
+journals_lock = threading.Lock()
+
+
+def drop_journals(workspace_id):
+    with journals_lock:
+        dropped = [
+            journals.pop(key) for key in list(journals) if key[0] == workspace_id
+        ]
+    for edit_journal in dropped:
+        edit_journal.close()
+
+
+workspaces = Workspaces(
+    os.path.join(UPLOAD_FOLDER, "workspaces"),
+    ttl=app.config["WORKSPACE_TTL"],
+    on_remove=drop_journals,
+)
+
+
+@app.before_request
+def open_workspace():
+    # Each browser gets its own workspace, named by a cookie
+    workspace_id = request.cookies.get("workspace")
+    if not Workspaces.is_valid_id(workspace_id):
+        workspace_id = Workspaces.new_id()
+    g.workspace_id = workspace_id
+
+
+@app.after_request
+def set_workspace_cookie(response):
+    # Renewed on every response, so the cookie lasts as long as the workspace
+    if "workspace_id" in g:
+        response.set_cookie(
+            "workspace",
+            g.workspace_id,
+            max_age=app.config["WORKSPACE_TTL"],
+            httponly=True,
+            samesite="Lax",
+        )
+    return response
+
+
+def folder_name(filing):
+    return secure_filename(filing or "") or "_"
+
+
+def filing_folder(filing, *parts):
+    # Folder of a filing in the session's workspace; tables are kept in
+    # "tables", the edit journal in "journal"
+    workspaces.open(g.workspace_id)
+    return workspaces.path(g.workspace_id, folder_name(filing), *parts)
+
+
+def journal(filing):
+    key = (g.workspace_id, folder_name(filing))
+    # Opening the workspace may prune others, which drops their journals
+    # under journals_lock, so the folder is found before taking it
+    folder = filing_folder(filing, "journal")
+    with journals_lock:
+        if key not in journals:
+            journals[key] = EditJournal(folder)
+        return journals[key]
 
 
 @app.route("/")
@@ -20,18 +100,142 @@ def index():
 
 @app.route("/process", methods=["POST"])
 def process():
+    # The parsed tables are saved to the session's workspace under "filing"
+    # (the file's name by default), so the editor need not upload them
     try:
         file = request.files["file"]
         if not file:
             return jsonify(error="No selected file"), 400
-        html_content = file.read().decode("utf-8")
-        processed_html = html_parsing.parse_html(html_content)
-        csv_tables, table_map = html2csv.process(processed_html)
-        return jsonify({"csv_tables": csv_tables, "table_map": table_map})
+        filing = request.form.get("filing") or file.filename
+        raw = file.read()
+        if request.args.get("stream"):
+            return Response(
+                stream_with_context(stream_tables(raw, filing)),
+                mimetype="application/x-ndjson",
+            )
+        cached = parse_cache.get(raw)
+        if cached:
+            csv_tables, table_map = cached
+        else:
+            html_content = encoding.decode_html(raw)
+            processed_html = html_parsing.parse_html(html_content)
+            csv_tables, table_map = html2csv.process(processed_html)
+            parse_cache.put(raw, csv_tables, table_map)
+        tables, restored = save_tables(filing, csv_tables)
+        return jsonify(
+            filing=filing,
+            tables=list(tables),
+            table_map=table_map,
+            restored=restored,
+        )
     except Exception as e:
         return jsonify(error=str(e)), 500
 
 
+def stream_tables(raw, filing):
+    # NDJSON lines: {"table", "tids"} per table as soon as it is normalized, where
+    # "tids" extends table_map, then, once the tables are saved, {"done",
+    # "table_map", "filing", "tables", "restored"}; {"error"} on failure
+    try:
+        cached = parse_cache.get(raw)
+        if cached:
+            csv_tables, table_map = cached
+            for i, csv_table in enumerate(csv_tables):
+                tids = table_map[1:] if i == 0 else []
+                yield json.dumps({"table": csv_table, "tids": tids}) + "\n"
+        else:
+            csv_tables, table_map = [], [0]
+            sent = 1
+            records = html_parsing.iter_parse_html(encoding.decode_html(raw))
+            for _, csv_table in html2csv.iter_process(records, table_map=table_map):
+                csv_tables.append(csv_table)
+                tids, sent = table_map[sent:], len(table_map)
+                yield json.dumps({"table": csv_table, "tids": tids}) + "\n"
+            parse_cache.put(raw, csv_tables, table_map)
+        tables, restored = save_tables(filing, csv_tables)
+        done = {
+            "done": True,
+            "table_map": table_map,
+            "filing": filing,
+            "tables": list(tables),
+            "restored": restored,
+        }
+        yield json.dumps(done) + "\n"
+    except Exception as e:
+        yield json.dumps({"error": str(e)}) + "\n"
+
+
+def save_tables(filing, tables):
+    """
+    Make the given tables the filing's saved tables. A filing edited before
+    keeps its journal, and its tables are rebuilt from it instead.
+
+    Args:
+        filing (str): Name of the filing, or None for tables of no filing
+        tables (list | dict): CSV texts, saved as table_{n}.csv, or
+                              filename -> CSV text
+
+    Returns:
+        tuple: (dict filename -> CSV text as saved, dict filename -> CSV
+               text of the rebuilt tables differing from those given)
+    """
+    if isinstance(tables, list):
+        tables = {f"table_{i + 1}.csv": text for i, text in enumerate(tables)}
+    restored = {}
+    with workspaces.lock(g.workspace_id):
+        if filing and not journal(filing).start(tables):
+            _, rebuilt = journal(filing).tables()
+            restored = {
+                filename: text
+                for filename, text in rebuilt.items()
+                if tables.get(filename) != text
+            }
+            tables = dict(tables, **rebuilt)
+        replace_folder(filing_folder(filing, "tables"), tables)
+    return tables, restored
+
+
+@app.route("/jobs", methods=["POST"])
+def submit_job():
+    file = request.files.get("file")
+    if not file:
+        return jsonify(error="No selected file"), 400
+    raw = file.read()
+    try:
+        job_id = parse_jobs.submit(raw, result=parse_cache.get(raw))
+    except QueueFull as e:
+        return jsonify(error=str(e)), 429, {"Retry-After": "10"}
+    return jsonify(job_id=job_id, status=parse_jobs.status(job_id)["status"]), 202
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    # ?wait=N long-polls for up to N seconds until the job finishes
+    wait = min(request.args.get("wait", 0, type=float), 60)
+    job = parse_jobs.status(job_id, wait)
+    if job is None:
+        return jsonify(error="Unknown job"), 404
+    response = {"job_id": job_id, "status": job["status"]}
+    if job["status"] == "done":
+        response["csv_tables"], response["table_map"] = job["result"]
+    elif job["status"] == "failed":
+        response["error"] = job["error"]
+    return jsonify(response)
+
+
+@app.route("/jobs", methods=["GET"])
+def job_stats():
+    return jsonify(parse_jobs.stats())
+
+
+@app.route("/cache_stats", methods=["GET"])
+def cache_stats():
+    stats = parse_cache.stats()
+    # Style parsing of the filings parsed in this process
+    stats["style_cache"] = css_style.cache_stats()
+    return jsonify(stats)
+
+
 @app.route("/upload_csv", methods=["POST"])
 def upload_csv():
     if "files" not in request.files:
@@ -41,30 +245,47 @@ def upload_csv():
     if not files:
         return jsonify(error="No selected file"), 400
 
-    upload_dir = os.path.join(app.config["UPLOAD_FOLDER"], "csv_uploads")
-    shutil.rmtree(upload_dir)
-    os.makedirs(upload_dir)
-
+    tables = {}
     for file in files:
         if file and file.filename:
             filename = secure_filename(file.filename)
-            filepath = os.path.join(upload_dir, filename)
-            file.save(filepath)
+            tables[filename] = file.read().decode("utf-8")
 
-    return jsonify(message="CSV files uploaded successfully")
+    # Tables of a filing edited before are rebuilt from its journal, and
+    # those differing from the upload are sent back
+    _, restored = save_tables(request.form.get("filing"), tables)
+    return jsonify(message="CSV files uploaded successfully", restored=restored)
 
 
 @app.route("/update_csv", methods=["POST"])
 def update_csv():
+    # {"filename", "deltas"}: csv_update instructions, counted as the editor
+    # counts rows, applied to the saved table and, with "filing", recorded
+    # in its journal; {"filename", "content"} replaces it whole, journaled
+    # too so that a re-upload of the filing rebuilds it
     try:
         data = request.get_json()
-        filename = data["filename"]
-        content = data["content"]
+        filename = secure_filename(data["filename"])
+        filing = data.get("filing")
 
-        upload_dir = os.path.join(app.config["UPLOAD_FOLDER"], "csv_uploads")
-        filepath = os.path.join(upload_dir, filename)
-        with open(filepath, "w") as f:
-            f.write(content)
+        with workspaces.lock(g.workspace_id):
+            filepath = filing_folder(filing, "tables", filename)
+            if "deltas" in data:
+                if not os.path.exists(filepath):
+                    return jsonify(error=f"No CSV file {filename}"), 404
+                # Only changes that applied are journaled, so a bad one
+                # cannot break every later rebuild of the filing
+                try:
+                    n = csv_update.apply_deltas(filepath, data["deltas"])
+                except ValueError as e:
+                    return jsonify(error=str(e)), 400
+                if filing:
+                    journal(filing).append(filename, data["deltas"])
+                return jsonify(message=f"Applied {n} changes to {filename}")
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            write_text(filepath, data["content"])
+            if filing:
+                journal(filing).replace(filename, data["content"])
 
         return jsonify(message="CSV file updated successfully")
     except Exception as e:
@@ -72,27 +293,93 @@ def update_csv():
         return jsonify(error=str(e)), 500
 
 
+@app.route("/tables/<filing>/<filename>", methods=["GET"])
+def saved_table(filing, filename):
+    with workspaces.lock(g.workspace_id):
+        path = filing_folder(filing, "tables", secure_filename(filename))
+        if not os.path.exists(path):
+            return jsonify(error=f"No CSV file {filename}"), 404
+        with open(path, "r", newline="", encoding="utf-8") as f:
+            return Response(f.read(), mimetype="text/csv")
+
+
+@app.route("/journal/<filing>", methods=["GET"])
+def journal_state(filing):
+    # The filing's tables rebuilt from its journal; ?since=N also lists the
+    # edits after the Nth
+    with workspaces.lock(g.workspace_id):
+        if not os.path.exists(filing_folder(filing, "journal")):
+            return jsonify(error="No journal for this filing"), 404
+        seq, tables = journal(filing).tables()
+        response = {"seq": seq, "tables": tables}
+        since = request.args.get("since", type=int)
+        if since is not None:
+            response["edits"] = [
+                entry for entry, _ in journal(filing).entries() if entry["seq"] > since
+            ]
+    return jsonify(response)
+
+
 @app.route("/download_csv", methods=["GET"])
 def download_csv():
-    upload_dir = os.path.join(app.config["UPLOAD_FOLDER"], "csv_uploads")
-    if not os.path.exists(upload_dir):
-        return jsonify(error="No CSV files found"), 404
-
-    zip_buffer = BytesIO()
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
-        for root, _, files in os.walk(upload_dir):
-            for file in files:
-                file_path = os.path.join(root, file)
-                zf.write(file_path, os.path.basename(file_path))
-
-    zip_buffer.seek(0)
-    return send_file(
-        zip_buffer,
+    # Streams tables.zip as it is built. ?filing= may be repeated, putting
+    # each filing's tables in a folder of its own; ?compression=stored
+    # leaves entries uncompressed; ?log=1 adds each filing's edit journal
+    # and ?manifest=1 a manifest.json listing every file with its sha256
+    filings = list(dict.fromkeys(request.args.getlist("filing"))) or [None]
+    folders = [folder_name(filing) for filing in filings]
+    if len(set(folders)) < len(folders):
+        # Their tables would land in the same folder, of the workspace and
+        # of the archive
+        return jsonify(error="Two filings have the same folder name"), 400
+    compression = request.args.get("compression", "deflated")
+    if compression not in ("stored", "deflated"):
+        return jsonify(error="compression must be stored or deflated"), 400
+    with workspaces.lock(g.workspace_id):
+        for filing in filings:
+            if not os.path.exists(filing_folder(filing, "tables")):
+                return jsonify(error="No CSV files found"), 404
+
+    manifest = None
+    if request.args.get("manifest"):
+        manifest = {
+            "filings": filings,
+            "compression": compression,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        }
+    archive = zip_stream.iter_zip(
+        download_entries(filings, bool(request.args.get("log"))),
+        zipfile.ZIP_STORED if compression == "stored" else zipfile.ZIP_DEFLATED,
+        manifest,
+    )
+    return Response(
+        stream_with_context(archive),
         mimetype="application/zip",
-        as_attachment=True,
-        download_name="tables.zip",
+        headers={"Content-Disposition": "attachment; filename=tables.zip"},
     )
 
 
+def download_entries(filings, with_log):
+    # Each file is opened under the workspace lock, so it is read whole as
+    # it was then even if an edit replaces it while the archive is sent
+    for filing in filings:
+        prefix = f"{folder_name(filing)}/" if len(filings) > 1 else ""
+        upload_dir = filing_folder(filing, "tables")
+        with workspaces.lock(g.workspace_id):
+            names = sorted(os.listdir(upload_dir)) if os.path.exists(upload_dir) else []
+        for name in names:
+            with workspaces.lock(g.workspace_id):
+                try:
+                    f = open(os.path.join(upload_dir, name), "rb")
+                except FileNotFoundError:
+                    continue
+            yield prefix + name, zip_stream.file_chunks(f)
+        if with_log and os.path.exists(filing_folder(filing, "journal")):
+            entries = journal(filing).entries()
+            yield prefix + "edit_log.jsonl", (
+                (json.dumps(entry) + "\n").encode("utf-8") for entry, _ in entries
+            )
+
+
 if __name__ == "__main__":
     app.run(debug=True)
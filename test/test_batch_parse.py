@@ -0,0 +1,34 @@
+import os
+
+from src import batch_parse
+
+
+def touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, "w").close()
+
+
+def test_filings_with_the_same_file_name_get_their_own_output(tmp_path):
+    root = str(tmp_path)
+    for sub in ("2019", "2020"):
+        touch(os.path.join(root, "in", sub, "x_10-Q.htm"))
+    touch(os.path.join(root, "in", "y_10-K.htm"))
+    touch(os.path.join(root, "other", "y_10-K.htm"))
+
+    filings = batch_parse.find_filings(
+        [os.path.join(root, "in"), os.path.join(root, "other", "*.htm")]
+    )
+    names = [name for _, name in filings]
+    assert names[:2] == ["2019/x_10-Q", "2020/x_10-Q"]
+    # Found under two inputs at the same relative path
+    assert len(set(names)) == 4
+    assert all(name.startswith("y_10-K_") for name in names[2:])
+
+
+def test_record_of_another_name_is_not_done(tmp_path):
+    path = str(tmp_path / "x.htm")
+    touch(path)
+    stat = os.stat(path)
+    record = {"status": "ok", "name": "x", "size": 0, "mtime": stat.st_mtime}
+    assert batch_parse.is_done(record, path, "x")
+    assert not batch_parse.is_done(record, path, "2019/x")
@@ -0,0 +1,85 @@
+import json
+import os
+import time
+
+from src import csv_update
+
+
+def replay(tmp_path, csv_text, instructions):
+    csv_folder = tmp_path / "csv"
+    csv_folder.mkdir()
+    (csv_folder / "table_1.csv").write_text(csv_text)
+    log = tmp_path / "log.json"
+    log.write_text(
+        json.dumps(
+            [dict(instruction, fileName="table_1.csv") for instruction in instructions]
+        )
+    )
+    csv_update.process_edits(str(csv_folder), str(log), str(tmp_path / "out"))
+    return (tmp_path / "out" / "table_1_edited.csv").read_text()
+
+
+def test_remove_col_removes_one_of_several_added_columns(tmp_path):
+    # The pandas replay dropped every column named "" here and wrote "a,b"
+    out = replay(
+        tmp_path,
+        "a,b\n1,2\n",
+        [
+            {"action": "add_col", "details": {"index": 2, "amount": 2}},
+            {"action": "remove_col", "details": {"index": 2, "amount": 1}},
+        ],
+    )
+    assert out == "a,b,\n1,2,\n"
+
+
+def test_csv_index_finds_what_find_csv_finds(tmp_path):
+    folder = tmp_path / "csv"
+    folder.mkdir()
+    for name in ("t.csv", "t_2.csv", "table_1.csv", ".t_hidden.csv", "a[1].csv"):
+        (folder / name).write_text("h\n")
+    (folder / "sub").mkdir()
+    (folder / "gone.csv").symlink_to(folder / "missing.csv")
+    index = csv_update.CsvIndex.load(str(folder))
+    for file_name in (
+        "t.csv",
+        "t.json",
+        "table_1.csv",
+        "table.csv",
+        ".t.csv",
+        "a[1].csv",
+        "a[1].txt",
+        "gone.csv",
+        "sub",
+        "sub/t.csv",
+        "..",
+        "none.csv",
+        "*.csv",
+    ):
+        assert index.find(file_name) == csv_update.find_csv(
+            str(folder), file_name
+        ), file_name
+
+
+def test_csv_index_cache(tmp_path):
+    folder = tmp_path / "csv"
+    folder.mkdir()
+    (folder / "t.csv").write_text("h\n")
+    cache_path = str(tmp_path / "index.json")
+    old = time.time() - 60
+    os.utime(folder, (old, old))
+    csv_update.CsvIndex.load(str(folder), cache_path)
+    assert os.path.exists(cache_path)
+
+    # The listing is read back while the folder's stamp is unchanged
+    with open(cache_path) as f:
+        cached = json.load(f)
+    with open(cache_path, "w") as f:
+        json.dump(dict(cached, names=["cached.csv"]), f)
+    assert csv_update.CsvIndex.load(str(folder), cache_path).names == ["cached.csv"]
+
+    # and listed again once it changes
+    (folder / "u.csv").write_text("h\n")
+    index = csv_update.CsvIndex.load(str(folder), cache_path)
+    assert sorted(index.names) == ["t.csv", "u.csv"]
+    index.add("v_edited.csv")
+    assert index.find("v.csv") == os.path.join(str(folder), "v_edited.csv")
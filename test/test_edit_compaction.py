@@ -0,0 +1,105 @@
+import random
+
+from src import csv_update
+from src.edit_compaction import compact_file
+
+ACTIONS = ["edit", "add_row", "remove_row", "add_col", "remove_col", "merge"]
+
+
+def random_instruction(rng):
+    action = rng.choice(ACTIONS)
+    if action == "edit":
+        details = {
+            "row": rng.randint(0, 5),
+            "col": rng.randint(-1, 4),
+            "newVal": rng.choice(["x", "y", "", None, 7, 2.5]),
+        }
+    elif action == "merge":
+        details = {"index": rng.randint(-1, 4), "isRow": rng.random() < 0.5}
+    else:
+        details = {"index": rng.randint(0, 5), "amount": rng.randint(0, 3)}
+    return {"action": action, "details": details}
+
+
+def random_csv(rng):
+    n_cols = rng.randint(1, 4)
+    lines = [",".join(f"c{i}" for i in range(n_cols))]
+    for _ in range(rng.randint(0, 4)):
+        lines.append(",".join(rng.choice(["1", "2.5", "a", ""]) for _ in range(n_cols)))
+    return "\n".join(lines) + "\n"
+
+
+def replay(tmp_path, csv_text, instructions, compact):
+    csv_path = tmp_path / "table_1.csv"
+    csv_path.write_text(csv_text)
+    out = tmp_path / f"out_{compact}.csv"
+    try:
+        csv_update.replay(str(csv_path), instructions, str(out), compact=compact)
+    except Exception as e:
+        # e.g. an edit of row 0, the last row, of a table without rows
+        return type(e).__name__
+    return out.read_text()
+
+
+def test_compacted_logs_leave_the_same_tables(tmp_path):
+    rng = random.Random(0)
+    for _ in range(300):
+        csv_text = random_csv(rng)
+        instructions = [random_instruction(rng) for _ in range(rng.randint(1, 12))]
+        assert replay(tmp_path, csv_text, instructions, True) == replay(
+            tmp_path, csv_text, instructions, False
+        ), (csv_text, instructions)
+
+
+def test_add_then_remove_of_the_same_columns_cancels():
+    instructions = [
+        {"action": "add_col", "details": {"index": 1, "amount": 2}},
+        {"action": "remove_col", "details": {"index": 1, "amount": 2}},
+    ]
+    assert compact_file(instructions, (2, 3)) == []
+
+
+def test_add_then_remove_of_the_same_rows_cancels():
+    instructions = [
+        {"action": "add_row", "details": {"index": 2, "amount": 1}},
+        {"action": "remove_row", "details": {"index": 2, "amount": 1}},
+    ]
+    assert compact_file(instructions, (3, 2)) == []
+
+
+def test_adjacent_ranges_merge():
+    rows = [
+        {"action": "remove_row", "details": {"index": 2, "amount": 1}},
+        {"action": "remove_row", "details": {"index": 2, "amount": 2}},
+    ]
+    assert compact_file(rows, (5, 2)) == [
+        {"action": "remove_row", "details": {"index": 2, "amount": 3}}
+    ]
+    cols = [
+        {"action": "add_col", "details": {"index": 1, "amount": 1}},
+        {"action": "add_col", "details": {"index": 2, "amount": 2}},
+    ]
+    assert compact_file(cols, (2, 3)) == [
+        {"action": "add_col", "details": {"index": 1, "amount": 3}}
+    ]
+
+
+def test_edits_of_one_cell_fold_into_the_first():
+    instructions = [
+        {
+            "action": "edit",
+            "details": {"row": 1, "col": 0, "oldVal": "a", "newVal": "b"},
+        },
+        {"action": "edit", "details": {"row": 2, "col": 0, "newVal": "x"}},
+        {
+            "action": "edit",
+            "details": {"row": 1, "col": 0, "oldVal": "b", "newVal": "c"},
+        },
+    ]
+    assert compact_file(instructions) == [
+        {
+            "action": "edit",
+            "details": {"row": 1, "col": 0, "oldVal": "a", "newVal": "c"},
+        },
+        {"action": "edit", "details": {"row": 2, "col": 0, "newVal": "x"}},
+    ]
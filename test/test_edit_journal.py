@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+from src import csv_update
+from src.edit_journal import EditJournal
+
+TABLE = "h1,h2\r\n1,2\r\n"
+
+
+def test_bad_delta_leaves_table_unchanged(tmp_path):
+    path = tmp_path / "table_1.csv"
+    path.write_bytes(TABLE.encode())
+    with pytest.raises(ValueError):
+        csv_update.apply_deltas(
+            str(path),
+            [
+                {"action": "edit", "details": {"row": 1, "col": 0, "newVal": "a"}},
+                {"action": "edit", "details": {"col": 0}},
+            ],
+        )
+    assert path.read_bytes() == TABLE.encode()
+
+
+def test_rebuild_skips_entry_that_fails(tmp_path):
+    journal = EditJournal(str(tmp_path))
+    journal.start({"table_1.csv": TABLE})
+    journal.append("table_1.csv", [{"action": "edit", "details": {"col": 0}}])
+    journal.append(
+        "table_1.csv",
+        [{"action": "edit", "details": {"row": 1, "col": 0, "newVal": "a"}}],
+    )
+    assert journal.tables() == (2, {"table_1.csv": "h1,h2\r\na,2\r\n"})
+
+
+def test_start_archives_earlier_journal(tmp_path):
+    journal = EditJournal(str(tmp_path))
+    journal.start({"table_1.csv": TABLE})
+    journal.append(
+        "table_1.csv",
+        [{"action": "edit", "details": {"row": 1, "col": 0, "newVal": "a"}}],
+    )
+    assert journal.start({"table_1.csv": "h1\r\n"})
+    (archived,) = os.listdir(journal.archive_dir)
+    with open(os.path.join(journal.archive_dir, archived, "journal.jsonl")) as f:
+        assert len(f.readlines()) == 1
+    assert journal.tables() == (0, {"table_1.csv": "h1\r\n"})
+
+
+def test_replace_drops_earlier_edits(tmp_path):
+    journal = EditJournal(str(tmp_path))
+    journal.start({"table_1.csv": TABLE})
+    journal.append(
+        "table_1.csv",
+        [{"action": "edit", "details": {"row": 1, "col": 0, "newVal": "a"}}],
+    )
+    journal.replace("table_1.csv", "x\r\ny\r\n")
+    journal.append(
+        "table_1.csv",
+        [{"action": "edit", "details": {"row": 1, "col": 0, "newVal": "z"}}],
+    )
+    assert journal.tables() == (3, {"table_1.csv": "x\r\nz\r\n"})
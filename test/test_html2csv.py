@@ -0,0 +1,48 @@
+from src import html2csv
+
+
+def test_all_number_table_keeps_ints():
+    html = "1,<table><tr><td>2019</td><td>1.5</td></tr><tr><td>2020</td><td>2.5</td></tr></table>"
+    csv_tables, table_map = html2csv.process(html)
+    assert csv_tables == ["2019,1.5\n2020,2.5"]
+    assert table_map == [0, 1]
+
+
+def test_all_number_table_with_colspan_keeps_ints():
+    html = (
+        '1,<table><tr><td>7</td><td colspan="2">7</td></tr>'
+        "<tr><td>45</td><td>100</td><td>1.5</td></tr></table>"
+    )
+    assert html2csv.process(html)[0] == ["7,7,7\n45,100,1.5"]
+
+
+def test_header_rows_are_column_labels():
+    # As pd.read_html: the <thead> row labels the columns and is not output
+    html = (
+        "1,<table><thead><tr><th>Year</th><th>Sales</th></tr></thead>"
+        "<tr><td>2019</td><td>1,234</td></tr><tr><td>2020</td><td>N/A</td></tr>"
+        "</table>"
+    )
+    assert html2csv.process(html)[0] == ["2019,1234\n2020,"]
+
+
+def test_header_of_two_rows_keeps_its_second_row():
+    # As to_csv wrote it, a line per header row, the first of which is cut
+    html = (
+        "1,<table><tr><th>Year</th><th>Sales</th></tr><tr><th>FY</th><th>USD</th></tr>"
+        '<tr><td>2019</td><td>1,234</td></tr><tr><td>2020</td><td>"5"</td></tr></table>'
+    )
+    assert html2csv.process(html)[0] == ['FY,USD\n2019,1234\n2020,"""5"""']
+
+
+def test_string_and_records_split_alike():
+    # A record without a numeric tid is read on its own in both modes
+    records = [
+        "1,<table><tr><td>a</td><td>1</td></tr><tr><td>b</td><td>2</td></tr></table>\n",
+        "unknown,<table><tr><td>c</td><td>3</td></tr><tr><td>d</td><td>4</td></tr></table>\n",
+        "2,<table><tr><td>e</td><td>5</td></tr><tr><td>f</td><td>6</td></tr></table>\n",
+    ]
+    expected = (["a,1\nb,2", "c,3\nd,4", "e,5\nf,6"], [0, 1, 2])
+    assert html2csv.process("".join(records)) == expected
+    assert html2csv.process(iter(records)) == expected
+    assert [tid for tid, _ in html2csv.iter_process(iter(records))] == [1, None, 2]
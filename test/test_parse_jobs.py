@@ -0,0 +1,53 @@
+import logging
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+from src.parse_jobs import JobQueue
+
+
+def test_job_finishes_when_on_done_fails(caplog):
+    def on_done(raw, csv_tables, table_map):
+        raise OSError("No space left on device")
+
+    queue = JobQueue(max_pending=1, on_done=on_done)
+    # A job as submit() leaves it while its parse runs
+    job_id = "job"
+    queue._jobs[job_id] = {"status": "queued", "finished": None}
+    future = Future()
+    future.set_result((["a,1\nb,2"], [0, 1]))
+    with caplog.at_level(logging.ERROR, logger="src.parse_jobs"):
+        queue._finish(job_id, b"", future)
+
+    job = queue.status(job_id)
+    assert job["status"] == "done"
+    assert job["result"] == (["a,1\nb,2"], [0, 1])
+    assert queue.stats()["pending"] == 0
+    assert "on_done of job job failed" in caplog.text
+
+
+class FakePool:
+    def __init__(self):
+        self.shutdown_calls = []
+
+    def shutdown(self, **kwargs):
+        self.shutdown_calls.append(kwargs)
+
+
+def test_broken_pool_is_shut_down_and_replaced_once():
+    queue = JobQueue()
+    broken, fresh = FakePool(), FakePool()
+    queue._pool = broken
+    for job_id in ("a", "b"):
+        queue._jobs[job_id] = {"status": "queued", "finished": None}
+
+    future = Future()
+    future.set_exception(BrokenProcessPool("A worker died"))
+    queue._finish("a", b"", future, broken)
+    assert queue._pool is None
+    assert broken.shutdown_calls == [{"wait": False, "cancel_futures": True}]
+
+    # A later failure from the old pool leaves the pool started since alone
+    queue._pool = fresh
+    queue._finish("b", b"", future, broken)
+    assert queue._pool is fresh
+    assert queue.status("b")["status"] == "failed"
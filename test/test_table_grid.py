@@ -0,0 +1,78 @@
+import io
+import random
+import warnings
+
+import pandas as pd
+
+from src import table_grid
+
+CELLS = [
+    "",
+    "2019",
+    "1.5",
+    "1,234",
+    "(1,234)",
+    "-3",
+    "1e5",
+    "3.0",
+    "abc",
+    "N/A",
+    "nan",
+    "NULL",
+    "True",
+    "false",
+    "TRUE",
+    "9999999999999999999",
+    "-9999999999999999999",
+    "18446744073709551616",
+    "1,",
+    ".5",
+    "inf",
+    "﻿1",
+    "12 345",
+]
+
+
+def random_table(rng):
+    rows = []
+    for r in range(rng.randint(1, 5)):
+        tag = "th" if r == 0 and rng.random() < 0.2 else "td"
+        tds = []
+        for _ in range(rng.randint(1, 4)):
+            span = f' colspan="{rng.randint(2, 3)}"' if rng.random() < 0.1 else ""
+            span += f' rowspan="{rng.randint(2, 3)}"' if rng.random() < 0.05 else ""
+            tds.append(f"<{tag}{span}>{rng.choice(CELLS)}</{tag}>")
+        rows.append("<tr>" + "".join(tds) + "</tr>")
+    return "<table>" + "".join(rows) + "</table>"
+
+
+def typed(tables):
+    return [
+        (columns, [[(type(v), v) for v in row] for row in rows])
+        for columns, rows in tables
+    ]
+
+
+def read_html(html):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        frames = pd.read_html(
+            io.StringIO(html), flavor="lxml", displayed_only=False, thousands=","
+        )
+    return [table_grid.frame_cells(df) for df in frames]
+
+
+def test_cells_are_typed_as_read_html_types_them():
+    rng = random.Random(0)
+    for _ in range(300):
+        html = random_table(rng)
+        try:
+            expected = typed(read_html(html))
+        except ValueError:
+            # A table with no text
+            expected = ValueError
+        try:
+            got = typed(table_grid.read_tables(io.StringIO(html)))
+        except ValueError:
+            got = ValueError
+        assert got == expected, html
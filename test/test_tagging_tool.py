@@ -0,0 +1,79 @@
+import io
+import os
+import threading
+import time
+import zipfile
+
+from src.workspace import Workspaces
+from test import tagging_tool
+
+
+def test_journal_while_pruning_does_not_deadlock(tmp_path, monkeypatch):
+    # Opening a filing's journal can prune an expired workspace, whose
+    # journals are dropped under the same lock journal() uses
+    workspaces = Workspaces(
+        str(tmp_path), ttl=1, prune_every=0, on_remove=tagging_tool.drop_journals
+    )
+    monkeypatch.setattr(tagging_tool, "workspaces", workspaces)
+    monkeypatch.setattr(tagging_tool, "journals", {})
+
+    stale_id, live_id = Workspaces.new_id(), Workspaces.new_id()
+    with tagging_tool.app.test_request_context():
+        tagging_tool.g.workspace_id = stale_id
+        tagging_tool.journal("old.htm")
+    old = time.time() - 60
+    os.utime(workspaces.path(stale_id), (old, old))
+
+    def open_journal():
+        with tagging_tool.app.test_request_context():
+            tagging_tool.g.workspace_id = live_id
+            tagging_tool.journal("f.htm")
+
+    thread = threading.Thread(target=open_journal, daemon=True)
+    thread.start()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert not os.path.exists(workspaces.path(stale_id))
+    assert list(tagging_tool.journals) == [(live_id, "f.htm")]
+
+
+def test_download_repeats_each_filing_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(tagging_tool, "workspaces", Workspaces(str(tmp_path)))
+    workspace_id = Workspaces.new_id()
+    for filing in ("a.htm", "b.htm"):
+        folder = tagging_tool.workspaces.path(workspace_id, filing, "tables")
+        os.makedirs(folder)
+        with open(os.path.join(folder, "table_1.csv"), "w") as f:
+            f.write("h\n1\n")
+
+    query = "/download_csv?filing=a.htm&filing=b.htm&filing=a.htm"
+    with tagging_tool.app.test_request_context(query):
+        tagging_tool.g.workspace_id = workspace_id
+        response = tagging_tool.download_csv()
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(response.response)))
+    assert archive.namelist() == ["a.htm/table_1.csv", "b.htm/table_1.csv"]
+
+    # Both names are saved as the same folder
+    with tagging_tool.app.test_request_context(
+        "/download_csv?filing=a.htm&filing=a%2Ehtm/"
+    ):
+        tagging_tool.g.workspace_id = workspace_id
+        assert tagging_tool.download_csv()[1] == 400
+
+
+def test_replaced_table_survives_reprocess(tmp_path, monkeypatch):
+    monkeypatch.setattr(tagging_tool, "workspaces", Workspaces(str(tmp_path)))
+    monkeypatch.setattr(tagging_tool, "journals", {})
+    workspace_id = Workspaces.new_id()
+    with tagging_tool.app.test_request_context():
+        tagging_tool.g.workspace_id = workspace_id
+        tagging_tool.save_tables("f.htm", ["h\r\n1\r\n"])
+    body = {"filing": "f.htm", "filename": "table_1.csv", "content": "h\r\n2\r\n"}
+    with tagging_tool.app.test_request_context(json=body):
+        tagging_tool.g.workspace_id = workspace_id
+        tagging_tool.update_csv()
+    # Parsing the filing again rebuilds the replaced table from the journal
+    with tagging_tool.app.test_request_context():
+        tagging_tool.g.workspace_id = workspace_id
+        tables, restored = tagging_tool.save_tables("f.htm", ["h\r\n1\r\n"])
+    assert tables == restored == {"table_1.csv": "h\r\n2\r\n"}
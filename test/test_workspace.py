@@ -0,0 +1,44 @@
+import os
+import threading
+import time
+
+from src.workspace import Workspaces
+
+
+def test_prune_removes_only_idle_unlocked_workspaces(tmp_path):
+    removed = []
+    workspaces = Workspaces(str(tmp_path), ttl=60, on_remove=removed.append)
+    stale, busy, fresh = (Workspaces.new_id() for _ in range(3))
+    old = time.time() - 120
+    for workspace_id in (stale, busy, fresh):
+        workspaces.open(workspace_id)
+    for workspace_id in (stale, busy):
+        os.utime(workspaces.path(workspace_id), (old, old))
+    # Not a workspace, however old
+    os.makedirs(tmp_path / "other")
+    os.utime(tmp_path / "other", (old, old))
+
+    # Another thread is working in busy
+    held, release = threading.Event(), threading.Event()
+
+    def hold():
+        with workspaces.lock(busy):
+            held.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=hold, daemon=True)
+    thread.start()
+    held.wait(5)
+    try:
+        assert workspaces.prune() == 1
+    finally:
+        release.set()
+        thread.join(5)
+
+    assert removed == [stale]
+    assert sorted(os.listdir(tmp_path)) == sorted([busy, fresh, "other"])
+    assert stale not in workspaces._locks
+
+    # Once it is free, busy goes in the next round
+    assert workspaces.prune() == 1
+    assert removed == [stale, busy]
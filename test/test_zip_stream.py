@@ -0,0 +1,49 @@
+import hashlib
+import io
+import json
+import zipfile
+
+import pytest
+
+from src import zip_stream
+
+
+@pytest.mark.parametrize("compression", [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED])
+def test_iter_zip_builds_a_readable_archive(compression):
+    big = bytes(range(256)) * 1000
+    entries = [
+        ("a.csv", [b"h\n", b"1\n"]),
+        ("dir/big.bin", zip_stream.file_chunks(io.BytesIO(big))),
+        ("empty.csv", []),
+    ]
+    data = b"".join(zip_stream.iter_zip(entries, compression, {"filings": ["f"]}))
+
+    archive = zipfile.ZipFile(io.BytesIO(data))
+    assert archive.testzip() is None
+    assert archive.namelist() == ["a.csv", "dir/big.bin", "empty.csv", "manifest.json"]
+    assert archive.read("a.csv") == b"h\n1\n"
+    assert archive.read("dir/big.bin") == big
+    assert {info.compress_type for info in archive.infolist()} == {compression}
+    manifest = json.loads(archive.read("manifest.json"))
+    assert manifest["filings"] == ["f"]
+    assert manifest["files"][1] == {
+        "name": "dir/big.bin",
+        "bytes": len(big),
+        "sha256": hashlib.sha256(big).hexdigest(),
+    }
+
+
+def test_iter_zip_is_lazy():
+    consumed = []
+
+    def entries():
+        for name in ("a.csv", "b.csv"):
+            consumed.append(name)
+            yield name, [b"x" * 100]
+
+    archive = zip_stream.iter_zip(entries(), zipfile.ZIP_STORED)
+    # The first entry is sent before the second is asked for
+    assert next(archive)
+    assert consumed == ["a.csv"]
+    list(archive)
+    assert consumed == ["a.csv", "b.csv"]